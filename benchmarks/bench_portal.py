@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark parsing, record construction, latency and fan-out throughput.
+
+Requests go to a local PortalSimulator. Results are written as JSON, to compare between releases:
+
+    python benchmarks/bench_portal.py --output before.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Callable
+from typing import Dict
+from typing import List
+
+import aiohttp
+
+from simulator import PortalSimulator
+from solarportal import CHUNK_SIZE
+from solarportal import Error
+from solarportal import Graph
+from solarportal import GRAPH_TYPE_DAY
+from solarportal import GRAPH_TYPE_YEAR
+from solarportal import Powerstation
+from solarportal import SolarPortal
+from solarportal import _xml_to_dict
+from solarportal.parsers import BACKENDS
+from solarportal.parsers import RecordBuilder
+from solarportal.parsers import XmlDictBuilder
+from solarportal.ratelimit import RetryPolicy
+
+
+def measure(func: Callable, repeat: int) -> Dict[str, float]:
+    """Seconds per call of func, best and median of repeat calls."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return {'best_s': min(durations), 'median_s': statistics.median(durations)}
+
+
+def percentiles(durations: List[float]) -> Dict[str, float]:
+    durations = sorted(durations)
+
+    def at(fraction):
+        return durations[min(int(len(durations) * fraction), len(durations) - 1)]
+
+    return {'p50_s': at(0.5), 'p95_s': at(0.95), 'p99_s': at(0.99), 'mean_s': statistics.mean(durations)}
+
+
+def parse_streaming(body: bytes, builder: XmlDictBuilder=None):
+    builder = builder or XmlDictBuilder()
+    for i in range(0, len(body), CHUNK_SIZE):
+        builder.feed(body[i:i + CHUNK_SIZE])
+    return builder.close()
+
+
+def bench_parse(simulator: PortalSimulator, repeat: int) -> Dict:
+    bodies = {
+        'powerstations': simulator.body({'method': 'Powerstationslist'}),
+        'errors': simulator.body({'method': 'Error', 'stationid': '1'}),
+        'graph_day': simulator.body({'method': 'Graph', 'stationid': '1', 'type': GRAPH_TYPE_DAY}),
+        'graph_year': simulator.body({'method': 'Graph', 'stationid': '1', 'type': GRAPH_TYPE_YEAR}),
+    }
+    results = {}
+    for name, body in bodies.items():
+        parsers = [('xml_to_dict', lambda: _xml_to_dict(ET.fromstring(body)))]
+        parsers.extend(('streaming.' + backend, lambda backend=backend: parse_streaming(
+            body, XmlDictBuilder(backend=backend))) for backend in sorted(BACKENDS))
+        for parser, func in parsers:
+            result = measure(func, repeat)
+            result['bytes'] = len(body)
+            result['mb_per_s'] = len(body) / result['best_s'] / 1e6
+            results['{}.{}'.format(name, parser)] = result
+    return results
+
+
+def bench_records(simulator: PortalSimulator, repeat: int) -> Dict:
+    stations = _xml_to_dict(ET.fromstring(simulator.body({'method': 'Powerstationslist'})))['power']
+    errors = _xml_to_dict(ET.fromstring(simulator.body({'method': 'Error', 'stationid': '1'})))['error']
+    graph = _xml_to_dict(ET.fromstring(simulator.body({'method': 'Graph', 'stationid': '1',
+                                                       'type': GRAPH_TYPE_YEAR})))
+    body = simulator.body({'method': 'Powerstationslist'})
+    cases = [
+        ('powerstations.parse_and_eager', lambda: [Powerstation(s) for s in parse_streaming(body)['power']],
+         len(stations)),
+        ('powerstations.direct', lambda: parse_streaming(body, RecordBuilder(Powerstation, 'power'))['power'],
+         len(stations)),
+        ('powerstations.eager', lambda: [Powerstation(s) for s in stations], len(stations)),
+        ('powerstations.lazy', lambda: [Powerstation(s, lazy=True) for s in stations], len(stations)),
+        ('errors.eager', lambda: [Error(e) for e in errors], len(errors)),
+        ('graph_year.eager', lambda: Graph(graph), 1),
+    ]
+    results = {}
+    for name, func, count in cases:
+        result = measure(func, repeat)
+        result['records'] = count
+        result['us_per_record'] = result['best_s'] / count * 1e6
+        results[name] = result
+    return results
+
+
+async def bench_latency(portal: SolarPortal, token, powerstations: List[Powerstation], calls: int) -> Dict:
+    durations = []
+    for i in range(calls):
+        powerstation = powerstations[i % len(powerstations)]
+        start = time.perf_counter()
+        await portal.async_get_data(token, powerstation)
+        durations.append(time.perf_counter() - start)
+    result = percentiles(durations)
+    result['calls'] = calls
+    return result
+
+
+async def bench_fan_out(portal: SolarPortal, token, powerstations: List[Powerstation],
+                        concurrency: int) -> Dict:
+    results = {}
+    cases = [
+        ('data', lambda: portal.async_get_data_many(token, powerstations, concurrency=concurrency)),
+        ('graph_day', lambda: portal.async_get_graph_many(token, powerstations, datetime.now(), GRAPH_TYPE_DAY,
+                                                          concurrency=concurrency)),
+    ]
+    for name, func in cases:
+        start = time.perf_counter()
+        values = await func()
+        duration = time.perf_counter() - start
+        failed = sum(1 for value in values if isinstance(value, Exception))
+        results[name] = {
+            'duration_s': duration,
+            'requests': len(values),
+            'failed': failed,
+            'requests_per_s': len(values) / duration,
+        }
+    return results
+
+
+async def async_bench_portal(simulator: PortalSimulator, args) -> Dict:
+    base_url = await simulator.start()
+    retry_policy = RetryPolicy(attempts=args.retries + 1, base_delay=0.01) if args.retries else None
+    portal = SolarPortal('manual', base_url=base_url, limit=args.concurrency, limit_per_host=args.concurrency,
+                         retry_policy=retry_policy)
+    try:
+        token = await portal.async_login('bench', 'bench')
+        powerstations = [powerstation async for powerstation in portal.aiter_powerstations(token)]
+        powerstations.sort(key=lambda powerstation: int(powerstation.station_id))
+        return {
+            'latency': await bench_latency(portal, token, powerstations, args.calls),
+            'fan_out': await bench_fan_out(portal, token, powerstations, args.concurrency),
+            'simulator': {'requests': simulator.requests, 'failures': simulator.failures},
+        }
+    finally:
+        await portal.aclose()
+        await simulator.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark solarportal against a local simulator')
+    parser.add_argument('--stations', type=int, default=1000, help='Number of powerstations')
+    parser.add_argument('--errors', type=int, default=1000, help='Number of errors per powerstation')
+    parser.add_argument('--graph-points', type=int, default=288, help='Points in a day graph')
+    parser.add_argument('--latency', type=float, default=0.005, help='Latency per request, in seconds')
+    parser.add_argument('--jitter', type=float, default=0.005, help='Extra random latency, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 503')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests failing with 429')
+    parser.add_argument('--retries', type=int, default=0, help='Retries for failed requests')
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent requests in fan-out')
+    parser.add_argument('--calls', type=int, default=100, help='Sequential calls for latency')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeats of parse and record benchmarks')
+    parser.add_argument('--output', default='-', help='JSON output file, - for stdout')
+    args = parser.parse_args()
+
+    simulator = PortalSimulator(stations=args.stations, errors=args.errors, graph_points=args.graph_points,
+                                latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                throttle_rate=args.throttle_rate)
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'aiohttp': aiohttp.__version__,
+        'config': vars(args),
+        'parse': bench_parse(simulator, args.repeat),
+        'records': bench_records(simulator, args.repeat),
+    }
+    loop = asyncio.get_event_loop()
+    report.update(loop.run_until_complete(async_bench_portal(simulator, args)))
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark memory and attribute access cost of records."""
+
+import timeit
+import tracemalloc
+from datetime import datetime
+
+from solarportal import Powerstation
+
+
+COUNT = 10000
+
+
+def powerstation_data(station_id: int) -> dict:
+    return {
+        'stationID': str(station_id),
+        'name': 'station_{}'.format(station_id),
+        'ActualPower': '100.1',
+        'TodayIncome': '1.00',
+        'TotalIncome': '10.0',
+        'etoday': '1.0',
+        'etotal': '300',
+        'LastTime': '1000000000',
+        'status': '0',
+        'longitude': '1.0000000',
+        'latitude': '2.0000000',
+        'country': 'Country',
+        'province': 'Province',
+        'city': 'City',
+        'unit': 'EUR',
+        'street': '',
+        'commissioning': '1000000000',
+        'WiFi': {'id': '600000000', 'inverter': '1'},
+    }
+
+
+class DictPowerstation:
+    """Powerstation as it was: keep the raw data, decode on every access."""
+
+    def __init__(self, data):
+        self._data = data
+
+    @property
+    def actual_power(self):
+        return float(self._data['ActualPower'])
+
+    @property
+    def etotal(self):
+        return int(self._data['etotal'])
+
+    @property
+    def last_time(self):
+        return datetime.fromtimestamp(int(self._data['LastTime']))
+
+
+def measure_memory(factory) -> float:
+    """Bytes per object, including the raw data it keeps alive."""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory(powerstation_data(i)) for i in range(COUNT)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del objects
+    return size / COUNT
+
+
+def measure_access(factory, number: int=100000) -> float:
+    """Microseconds per access of actual_power, etotal and last_time."""
+    obj = factory(powerstation_data(1))
+    duration = timeit.timeit(lambda: (obj.actual_power, obj.etotal, obj.last_time), number=number)
+    return duration / number * 1e6
+
+
+def main():
+    variants = [
+        ('dict (before)', DictPowerstation),
+        ('eager', Powerstation),
+        ('lazy', lambda data: Powerstation(data, lazy=True)),
+    ]
+    print('{:<16} {:>14} {:>14}'.format('variant', 'bytes/object', 'us/access'))
+    for name, factory in variants:
+        print('{:<16} {:>14.0f} {:>14.3f}'.format(name, measure_memory(factory), measure_access(factory)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Local simulator of the /serverapi/ endpoint of a portal, for benchmarks."""
+
+import asyncio
+import random
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from aiohttp import web
+
+
+BASE_TIME = 1500000000
+
+ERROR_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<error>
+    <status>false</status>
+    <errorCode>{code}</errorCode>
+    <errorMessage>{message}</errorMessage>
+</error>'''
+
+
+def _document(root: str, elements: List[str]) -> str:
+    return '<?xml version="1.0" encoding="utf-8" ?>\n<{root}>\n    <status>true</status>\n{body}\n</{root}>'.format(
+        root=root, body='\n'.join(elements))
+
+
+def powerstation_xml(station_id: int) -> str:
+    return '''    <power>
+        <stationID>{id}</stationID>
+        <name>station_{id}</name>
+        <ActualPower>{power}</ActualPower>
+        <TodayIncome>1.00</TodayIncome>
+        <TotalIncome>{income}</TotalIncome>
+        <etoday>{etoday}</etoday>
+        <etotal>{etotal}</etotal>
+        <LastTime>{time}</LastTime>
+        <status>0</status>
+        <longitude>5.1234567</longitude>
+        <latitude>52.1234567</latitude>
+        <country>Netherlands</country>
+        <province>Utrecht</province>
+        <city>Utrecht</city>
+        <unit>EUR</unit>
+        <street></street>
+        <commissioning>{commissioning}</commissioning>
+        <WiFi><id>{wifi}</id><inverter>1</inverter></WiFi>
+    </power>'''.format(id=station_id, power=station_id % 3700 / 10.0, income=station_id * 1.5,
+                       etoday=station_id % 300 / 10.0, etotal=station_id * 10, time=BASE_TIME,
+                       commissioning=BASE_TIME - 86400 * 365, wifi=600000000 + station_id)
+
+
+def data_xml(station_id: int, updated: int) -> str:
+    return _document('data', [
+        '    <errorCode> </errorCode>',
+        '    <errorMessage> </errorMessage>',
+        '    <name>station_{}</name>'.format(station_id),
+        '    <income><TodayIncome>1.00</TodayIncome><ActualPower>{}</ActualPower><etoday>{}</etoday>'
+        '<etotal>{}</etotal><TotalIncome>{}</TotalIncome></income>'.format(
+            station_id % 3700 / 10.0, station_id % 300 / 10.0, station_id * 10, station_id * 1.5),
+        '    <detail><Capacity>3.7</Capacity><commissioning>{}</commissioning>'
+        '<lastupdated>{}</lastupdated></detail>'.format(BASE_TIME - 86400 * 365, updated),
+    ])
+
+
+def graph_xml(points: int, step: int) -> str:
+    elements = ['    <daypower>{}</daypower>'.format(points / 10.0)]
+    elements.extend('    <graph><datetime>{}</datetime><power>{}</power></graph>'.format(
+        BASE_TIME + i * step, (i % 100) * 37.0) for i in range(points))
+    return _document('graphs', elements)
+
+
+def errors_xml(station_id: int, first: int, count: int, total: int) -> str:
+    elements = ['    <errTotal>{}</errTotal>'.format(total)]
+    elements.extend('''    <error>
+        <DateTime>{}</DateTime>
+        <inverter>NLBN{:010d}</inverter>
+        <invErrCode>{}</invErrCode>
+        <state>{}</state>
+        <text>Isolation fault</text>
+    </error>'''.format(BASE_TIME - i * 3600, station_id, 100 + i % 20, i % 2) for i in range(first, first + count))
+    return _document('list', elements)
+
+
+class PortalSimulator:
+    """
+    Simulator of the /serverapi/ endpoint of a portal.
+
+    Responses are generated for stations number of powerstations, errors number of errors per
+    powerstation and graphs of graph_points points per day. Every response is delayed by latency
+    (plus up to jitter) seconds, error_rate of the requests fail with a 503 and throttle_rate of
+    the requests with a 429. Generated bodies are kept, so generating them is measured only once.
+    """
+
+    def __init__(self, stations: int=1000, errors: int=1000, graph_points: int=288,
+                 latency: float=0.0, jitter: float=0.0, error_rate: float=0.0, throttle_rate: float=0.0,
+                 seed: int=0):
+        """Initializer."""
+        self.stations = stations
+        self.errors = errors
+        self.graph_points = graph_points
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._bodies = {}  # type: Dict[Tuple, bytes]
+        self._runner = None  # type: web.AppRunner
+
+    def body(self, params) -> bytes:
+        """Generate (or get the previously generated) body for request parameters."""
+        method = params.get('method')
+        page = int(params.get('page', 1))
+        per_page = int(params.get('perPage', 0))
+        key = (method, params.get('stationid'), params.get('type'), page, per_page)
+        if key in self._bodies:
+            return self._bodies[key]
+
+        if method == 'Login':
+            body = _document('login', ['    <userID>1</userID>', '    <userName>{}</userName>'.format(
+                params.get('username')), '    <token>simulated_token</token>'])
+        elif method == 'Logout':
+            body = _document('logout', [])
+        elif method == 'PowerstationslistCount':
+            body = _document('list', ['    <recordCount>{}</recordCount>'.format(self.stations)])
+        elif method == 'Powerstationslist':
+            first, count = (page - 1) * per_page, per_page or self.stations
+            body = _document('list', [powerstation_xml(i)
+                                      for i in range(first + 1, min(first + count, self.stations) + 1)])
+        elif method == 'Data':
+            body = data_xml(int(params['stationid']), BASE_TIME)
+        elif method == 'Graph':
+            points, step = {'1': (self.graph_points, 86400 // max(self.graph_points, 1)),
+                            '2': (31, 86400), '3': (365, 86400)}[params.get('type', '1')]
+            body = graph_xml(points, step)
+        elif method == 'Error':
+            per_page = per_page or self.errors
+            first = (page - 1) * per_page
+            body = errors_xml(int(params['stationid']), first, max(min(per_page, self.errors - first), 0),
+                              self.errors)
+        else:
+            body = ERROR_RESPONSE.format(code='2', message='Unknown method')
+
+        self._bodies[key] = body.encode('utf-8')
+        return self._bodies[key]
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + self._random.random() * self.jitter)
+
+        roll = self._random.random()
+        if roll < self.error_rate:
+            self.failures += 1
+            return web.Response(status=503)
+        if roll < self.error_rate + self.throttle_rate:
+            self.failures += 1
+            return web.Response(status=429)
+
+        return web.Response(body=self.body(request.query), content_type='text/xml')
+
+    def create_app(self, loop=None) -> web.Application:
+        app = web.Application()
+        app.router.add_route('GET', '/serverapi/', self.handle)
+        return app
+
+    async def start(self, host: str='127.0.0.1', port: int=0) -> str:
+        """Start serving, returns the base_url for SolarPortal."""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return 'http://{}:{}/serverapi/?'.format(host, port)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -33,6 +33,14 @@ INSTALL_REQUIRES=[
 ]
 
 
+EXTRAS_REQUIRE={
+    'numpy': ['numpy'],
+    'pandas': ['pandas'],
+    'parquet': ['pyarrow'],
+    'lxml': ['lxml'],
+}
+
+
 TEST_REQUIRES=[
     'pytest',
     'pytest-aiohttp',
@@ -52,14 +60,16 @@ setup(
         'Development Status :: 5 - Production/Stable',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: Apache Software License',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
     ],
     packages=['solarportal'],
+    python_requires='>=3.6',
     tests_require=TEST_REQUIRES,
     install_requires=INSTALL_REQUIRES,
+    extras_require=EXTRAS_REQUIRE,
     cmdclass={'test': PyTest},
     scripts=[
+        'bin/solarportal-daemon',
         'bin/solarportal-to-csv',
         'bin/solarportal-to-pvoutput',
     ]
@@ -1,16 +1,42 @@
 # -*- coding: utf-8 -*-
 """Solarportal API for python."""
 
+import asyncio
 import hashlib
 import logging
+import time
+from array import array
+from collections.abc import Sequence
+from concurrent.futures import Executor
 from datetime import datetime
+from datetime import timedelta
+from typing import AsyncIterator
+from typing import Awaitable
+from typing import Callable
 from typing import Dict
+from typing import Iterable
 from typing import List
 from typing import Mapping
+from typing import Optional
+from typing import Tuple
+from typing import Union
 from urllib.parse import quote as urlquote
-from xml.etree import ElementTree as ET
 
 import aiohttp
+from yarl import URL
+
+from solarportal.cache import ResponseCache
+from solarportal.metrics import MetricsRegistry
+from solarportal.parsers import PARSE_ERRORS
+from solarportal.parsers import RecordBuilder
+from solarportal.parsers import XmlDictBuilder as _XmlDictBuilder
+from solarportal.parsers import _xml_add_value  # noqa: F401
+from solarportal.parsers import _xml_to_dict  # noqa: F401
+from solarportal.parsers import get_backend
+from solarportal.parsers import parse_response
+from solarportal.ratelimit import AdaptiveConcurrency
+from solarportal.ratelimit import RetryPolicy
+from solarportal.ratelimit import TokenBucket
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -20,13 +46,46 @@ class SolarPortalError(Exception):
     """SolarPortalException."""
 
 
+class SolarPortalHttpError(SolarPortalError):
+    """HTTP status code from the portal was not ok."""
+
+    def __init__(self, status: int):
+        """Initializer."""
+        super().__init__('Status code not ok: %s' % (status, ))
+        self.status = status
+
+    def __reduce__(self):
+        return type(self), (self.status, )
+
+
+class SolarPortalApiError(SolarPortalError):
+    """Portal reported an error, such as an authorization error."""
+
+    def __init__(self, error_code: str, error_message: str):
+        """Initializer."""
+        super().__init__('Error: %s, %s' % (error_code, error_message))
+        self.error_code = error_code
+        self.error_message = error_message
+
+    def __reduce__(self):
+        return type(self), (self.error_code, self.error_message)
+
+
+class SolarPortalParseError(SolarPortalError):
+    """Response from the portal could not be parsed, such as an HTML maintenance page."""
+
+
+# errors which are reported per powerstation by the *_many methods
+FAN_OUT_ERRORS = (SolarPortalError, aiohttp.ClientError, asyncio.TimeoutError, ValueError)
+
+
 class Token:
     """Token for portal."""
 
-    def __init__(self, data: Mapping):
+    def __init__(self, data: Mapping, created: datetime=None):
         """Initializer."""
         self._data = data
-        self.created = datetime.now()
+        self.created = created or datetime.now()
 
     @property
     def user_id(self):
@@ -41,345 +100,369 @@ class Token:
         return self._data['token']
 
     def __repr__(self):
-        return '<Token({}, {})>'.format(self.username, self.token)
+        return '<Token({}, ***)>'.format(self.username)
 
 
-class Inverter:
-    """Inverter from the portal."""
+_REQUIRED = object()
 
-    def __init__(self, data: Mapping):
-        """Initializer."""
-        self._data = data
+# errors of a field which is missing or can not be decoded
+_DECODE_ERRORS = (KeyError, ValueError, TypeError)
 
-    @property
-    def sn(self):
-        return self._data['sn']
 
-    @property
-    def status(self):
-        return self._data['status']
+def _text(value):
+    return value
 
-    @property
-    def power(self):
-        return float(self._data['power'])
 
-    @property
-    def etoday(self):
-        return float(self._data['etoday'])
+def _timestamp(value) -> datetime:
+    return datetime.fromtimestamp(int(value))
 
-    @property
-    def energy_today(self):
-        return self.etoday
 
-    @property
-    def etotal(self):
-        return int(self._data['etotal'])
+class _Record:
+    """
+    Record from the portal.
 
-    @property
-    def energy_total(self):
-        return self.etotal
+    Fields are decoded once, at construction. When lazy, the raw data is kept and
+    each field is decoded on first access instead. A field which is missing or can not
+    be decoded, such as an empty number, is left out: accessing it raises AttributeError.
+    """
 
-    @property
-    def lastupdated(self):
-        ts = int(self._data['lastupdated'])
-        return datetime.fromtimestamp(ts)
-
-    @property
-    def mode(self):
-        return self._data['mode']
+    __slots__ = ('_data', )
 
+    # name -> (path in data, converter, default when missing)
+    _FIELDS = {}  # type: Dict[str, Tuple[Tuple[str, ...], Callable, object]]
 
-class WiFi:
-    """WiFi from the portal."""
-
-    def __init__(self, data: Mapping):
+    def __init__(self, data: Mapping, lazy: bool=False):
         """Initializer."""
         self._data = data
-
-    @property
-    def id(self):
-        return self._data['id']
-
-    @property
-    def inverter(self):
-        if isinstance(self._data['inverter'], dict):
-            return Inverter(self._data['inverter'])
-
-        return self._data['inverter']
+        if lazy:
+            return
+
+        for name in self._FIELDS:
+            try:
+                setattr(self, name, self._decode(name))
+            except _DECODE_ERRORS:
+                pass
+        self._data = None
+
+    @classmethod
+    def _from_fields(cls, values: Mapping) -> '_Record':
+        """Create from raw values by field name, as collected by a RecordBuilder."""
+        record = cls.__new__(cls)
+        record._data = None
+        for name, (_, converter, default) in cls._FIELDS.items():
+            if name in values:
+                try:
+                    value = converter(values[name])
+                except _DECODE_ERRORS:
+                    continue
+            elif default is _REQUIRED:
+                continue
+            else:
+                value = default
+            setattr(record, name, value)
+        return record
+
+    def _decode(self, name: str):
+        path, converter, default = self._FIELDS[name]
+        value = self._data
+        for key in path:
+            if key not in value:
+                if default is _REQUIRED:
+                    raise KeyError(key)
+                return default
+            value = value[key]
+        return converter(value)
+
+    def __getattr__(self, name: str):
+        # only called for fields which are not decoded yet
+        if name == '_data' or name not in self._FIELDS or self._data is None:
+            raise AttributeError(name)
+
+        try:
+            value = self._decode(name)
+        except _DECODE_ERRORS as exc:
+            raise AttributeError(name) from exc
+        setattr(self, name, value)
+        return value
+
+
+def _fields(**fields) -> Dict[str, Tuple[Tuple[str, ...], Callable, object]]:
+    """Build _FIELDS from name=(path, converter[, default]), path is a key or a tuple of keys."""
+    result = {}
+    for name, spec in fields.items():
+        path = spec[0] if isinstance(spec[0], tuple) else (spec[0], )
+        default = spec[2] if len(spec) > 2 else _REQUIRED
+        result[name] = (path, spec[1], default)
+    return result
 
 
-class Data:
-    """Data from the portal."""
+class Inverter(_Record):
+    """Inverter from the portal."""
 
-    def __init__(self, data: Mapping):
-        """Initializer."""
-        self._data = data
+    _FIELDS = _fields(
+        sn=('sn', _text),
+        status=('status', _text),
+        power=('power', float),
+        etoday=('etoday', float),
+        etotal=('etotal', int),
+        lastupdated=('lastupdated', _timestamp),
+        mode=('mode', _text),
+    )
+    __slots__ = tuple(_FIELDS)
 
     @property
-    def pic(self):
-        return self._data['pic']
+    def energy_today(self):
+        return self.etoday
 
     @property
-    def name(self):
-        return self._data['name']
+    def energy_total(self):
+        return self.etotal
 
-    @property
-    def country(self):
-        return self._data['country']
 
-    @property
-    def province(self):
-        return self._data['province']
+def _inverter(value):
+    if isinstance(value, dict):
+        return Inverter(value)
 
-    @property
-    def city(self):
-        return self._data['city']
+    return value
 
-    @property
-    def street(self):
-        return self._data['street']
 
-    @property
-    def sunrise(self):
-        return self._data['sunrise']
+class WiFi(_Record):
+    """WiFi from the portal."""
 
-    @property
-    def sunset(self):
-        return self._data['sunset']
+    _FIELDS = _fields(
+        id=('id', _text),
+        inverter=('inverter', _inverter),
+    )
+    __slots__ = tuple(_FIELDS)
 
-    @property
-    def today_income(self):
-        return float(self._data['income']['TodayIncome'])
 
-    @property
-    def actual_power(self):
-        return float(self._data['income']['ActualPower'])
+class Data(_Record):
+    """Data from the portal."""
 
-    @property
-    def etoday(self):
-        return float(self._data['income']['etoday'])
+    _FIELDS = _fields(
+        pic=('pic', _text),
+        name=('name', _text),
+        country=('country', _text),
+        province=('province', _text),
+        city=('city', _text),
+        street=('street', _text),
+        sunrise=('sunrise', _text),
+        sunset=('sunset', _text),
+        today_income=(('income', 'TodayIncome'), float),
+        actual_power=(('income', 'ActualPower'), float),
+        etoday=(('income', 'etoday'), float),
+        etotal=(('income', 'etotal'), int),
+        total_income=(('income', 'TotalIncome'), float),
+        capacity=(('detail', 'Capacity'), float),
+        commissioning=(('detail', 'commissioning'), _timestamp),
+        last_updated=(('detail', 'lastupdated'), _timestamp),
+        wifi=(('detail', 'WiFi'), WiFi, None),
+        today_save_tree=(('saving', 'TodaySaveTree'), float),
+        total_save_tree=(('saving', 'TotalSaveTree'), float),
+        today_save_co2=(('saving', 'TodaySaveCo2'), float),
+        total_save_co2=(('saving', 'TotalSaveCo2'), float),
+    )
+    __slots__ = tuple(_FIELDS)
 
     @property
     def energy_today(self):
         return self.etoday
 
-    @property
-    def etotal(self):
-        return int(self._data['income']['etotal'])
-
     @property
     def energy_total(self):
-        return self.energy_total
+        return self.etotal
 
-    @property
-    def total_income(self):
-        return float(self._data['income']['TotalIncome'])
 
-    @property
-    def capacity(self):
-        return float(self._data['detail']['Capacity'])
+def _graph_arrays(value) -> Tuple[array, array]:
+    # ensure always a list
+    if isinstance(value, dict):
+        value = [value]
 
-    @property
-    def commissioning(self):
-        ts = int(self._data['detail']['commissioning'])
-        return datetime.fromtimestamp(ts)
+    timestamps = array('d', [float(graph['datetime']) for graph in value])
+    powers = array('d', [float(graph['power']) for graph in value])
+    return timestamps, powers
 
-    @property
-    def last_updated(self):
-        ts = int(self._data['detail']['lastupdated'])
-        return datetime.fromtimestamp(ts)
 
-    @property
-    def wifi(self):
-        if 'WiFi' not in self._data['detail']:
-            return None
+class _GraphPoints(Sequence):
+    """Graph points as a list of dicts, created on access from the columnar data."""
 
-        return WiFi(self._data['detail']['WiFi'])
+    __slots__ = ('_timestamps', '_powers')
 
-    @property
-    def today_save_tree(self):
-        return float(self._data['saving']['TodaySaveTree'])
+    def __init__(self, timestamps: array, powers: array):
+        """Initializer."""
+        self._timestamps = timestamps
+        self._powers = powers
 
-    @property
-    def total_save_tree(self):
-        return float(self._data['saving']['TotalSaveTree'])
+    def __len__(self):
+        return len(self._timestamps)
 
-    @property
-    def today_save_co2(self):
-        return float(self._data['saving']['TodaySaveCo2'])
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
 
-    @property
-    def total_save_co2(self):
-        return float(self._data['saving']['TotalSaveCo2'])
+        return {
+            'datetime': datetime.fromtimestamp(self._timestamps[index]),
+            'power': self._powers[index],
+        }
 
 
-class Graph:
-    """Graph from the portal."""
+class Graph(_Record):
+    """
+    Graph from the portal.
 
-    def __init__(self, data: Mapping):
-        """Initializer."""
-        self._data = data
+    Points are stored as parallel arrays of epoch seconds and power, both float64. A graph
+    without points, such as a day before commissioning, has empty arrays.
+    """
 
-    @property
-    def day_power(self):
-        return float(self._data['daypower'])
+    _FIELDS = _fields(
+        day_power=('daypower', float),
+        income=('income', float),
+        save_tree=('savetree', float),
+        save_co2=('saveco2', float),
+        _points=('graph', _graph_arrays, None),
+    )
+    __slots__ = tuple(_FIELDS)
 
     @property
-    def income(self):
-        return float(self._data['income'])
+    def _arrays(self) -> Tuple[array, array]:
+        if self._points is None:
+            return array('d'), array('d')
+        return self._points
 
     @property
-    def save_tree(self):
-        return float(self._data['savetree'])
+    def timestamps(self) -> memoryview:
+        """Epoch seconds of the points, zero-copy."""
+        return memoryview(self._arrays[0])
 
     @property
-    def save_co2(self):
-        return float(self._data['saveco2'])
+    def powers(self) -> memoryview:
+        """Power of the points, zero-copy."""
+        return memoryview(self._arrays[1])
 
     @property
-    def graph_points(self):
-        return [
-            {
-                'datetime': datetime.fromtimestamp(float(graph['datetime'])),
-                'power': float(graph['power']),
-            }
-            for graph in self._data['graph']
-        ]
-
-
-class Powerstation:
-    """Station from the portal."""
+    def graph_points(self) -> Sequence:
+        return _GraphPoints(*self._arrays)
 
-    def __init__(self, data: Mapping):
-        """Initializer."""
-        self._data = data
+    def to_numpy(self):
+        """Get (timestamps, powers) as numpy arrays, sharing memory with this graph."""
+        import numpy
 
-    @property
-    def station_id(self):
-        return self._data['stationID']
+        timestamps, powers = self._arrays
+        return (numpy.frombuffer(timestamps, dtype=numpy.float64),
+                numpy.frombuffer(powers, dtype=numpy.float64))
 
-    @property
-    def name(self):
-        return self._data['name']
+    def to_pandas(self):
+        """Get a pandas DataFrame with a power column, indexed by UTC datetime."""
+        import pandas
 
-    @property
-    def actual_power(self):
-        return float(self._data['ActualPower'])
+        timestamps, powers = self.to_numpy()
+        index = pandas.to_datetime(timestamps, unit='s', utc=True)
+        return pandas.DataFrame({'power': powers}, index=index)
 
-    @property
-    def today_income(self):
-        return float(self._data['TodayIncome'])
 
-    @property
-    def total_income(self):
-        return float(self._data['TotalIncome'])
+class Powerstation(_Record):
+    """Station from the portal."""
 
-    @property
-    def etoday(self):
-        return float(self._data['etoday'])
+    _FIELDS = _fields(
+        station_id=('stationID', _text),
+        name=('name', _text),
+        actual_power=('ActualPower', float),
+        today_income=('TodayIncome', float),
+        total_income=('TotalIncome', float),
+        etoday=('etoday', float),
+        etotal=('etotal', int),
+        last_time=('LastTime', _timestamp),
+        status=('status', int),
+        longitude=('longitude', float),
+        latitude=('latitude', float),
+        country=('country', _text),
+        province=('province', _text),
+        city=('city', _text),
+        commissioning=('commissioning', _timestamp),
+        street=('street', _text),
+        unit=('unit', _text),
+        wifi=('WiFi', WiFi, None),
+    )
+    __slots__ = tuple(_FIELDS)
 
-    @property
-    def etotal(self):
-        return int(self._data['etotal'])
+    def __repr__(self):
+        return '<Powerstation({})>'.format(self.station_id)
 
-    @property
-    def last_time(self):
-        ts = int(self._data['LastTime'])
-        return datetime.fromtimestamp(ts)
 
-    @property
-    def status(self):
-        return int(self._data['status'])
+class Error(_Record):
+    """Error from the portal."""
 
-    @property
-    def longitude(self):
-        return float(self._data['longitude'])
+    _FIELDS = _fields(
+        datetime=('DateTime', _timestamp),
+        inverter=('inverter', _text),
+        inv_err_code=('invErrCode', _text),
+        state=('state', _text),
+        text=('text', _text),
+    )
+    __slots__ = tuple(_FIELDS)
 
-    @property
-    def latitude(self):
-        return float(self._data['latitude'])
 
-    @property
-    def country(self):
-        return self._data['country']
+CHUNK_SIZE = 16 * 1024
 
-    @property
-    def province(self):
-        return self._data['province']
 
-    @property
-    def city(self):
-        return self._data['city']
+GRAPH_TYPE_DAY = '1'
+GRAPH_TYPE_MONTH = '2'
+GRAPH_TYPE_YEAR = '3'
 
-    @property
-    def commissioning(self):
-        ts = int(self._data['commissioning'])
-        return datetime.fromtimestamp(ts)
 
-    @property
-    def street(self):
-        return self._data['street']
+def _graph_period_end(now: datetime, type: str) -> Optional[datetime]:
+    """Get the end of the period a graph covers, None if unknown."""
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if type == GRAPH_TYPE_DAY:
+        return start + timedelta(days=1)
+    if type == GRAPH_TYPE_MONTH:
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1, day=1)
+        return start.replace(month=start.month + 1, day=1)
+    if type == GRAPH_TYPE_YEAR:
+        return start.replace(year=start.year + 1, month=1, day=1)
+    return None
 
-    @property
-    def unit(self):
-        return self._data['unit']
 
-    @property
-    def wifi(self):
-        if 'WiFi' not in self._data:
-            return None
+def _graph_is_final(now: datetime, type: str) -> bool:
+    """Test if the graph covers a period which has passed, and will not change anymore."""
+    end = _graph_period_end(now, type)
+    return end is not None and end <= datetime.now(now.tzinfo)
 
-        return WiFi(self._data['WiFi'])
 
-    def __repr__(self):
-        return '<Powerstation({})>'.format(self.station_id)
+# parameters which do not change the response
+_UNCACHED_PARAMS = ('token', 'password')
 
 
-class Error:
-    """Error from the portal."""
+# parameters which are the same for all requests with a token, in this order
+_STATIC_PARAMS = ('method', 'username', 'token', 'key')
 
-    def __init__(self, data: Mapping):
-        """Initializer."""
-        self._data = data
+# parameters which are never logged
+_SECRET_PARAMS = ('token', 'password')
 
-    @property
-    def datetime(self):
-        ts = int(self._data['DateTime'])
-        return datetime.fromtimestamp(ts)
 
-    @property
-    def inverter(self):
-        return self._data['inverter']
+class _Redacted:
+    """Parameters for logging, formatted only when logged, without secrets."""
 
-    @property
-    def inv_err_code(self):
-        return self._data['invErrCode']
+    __slots__ = ('_params', )
 
-    @property
-    def state(self):
-        return self._data['state']
+    def __init__(self, params: Mapping):
+        """Initializer."""
+        self._params = params
 
-    @property
-    def text(self):
-        return self._data['text']
+    def __str__(self):
+        return '&'.join(
+            key + '=' + ('***' if key in _SECRET_PARAMS else value)
+            for key, value in self._params.items()
+        )
 
 
-def _xml_to_dict(el: ET.Element) -> Dict:
-    """Convert XML to Dict."""
-    result = {}
-    for el_child in el:
-        key = el_child.tag
-        if len(el_child):
-            value = _xml_to_dict(el_child)
-        else:
-            value = el_child.text or ''
-        if key not in result:
-            result[key] = value
-        elif isinstance(result[key], list):
-            result[key] = result[key] + [value]
-        else:
-            result[key] = [result[key]] + [value]
-    return result
+def _cache_key(params: Mapping) -> Tuple:
+    return tuple(sorted(
+        (key, value)
+        for key, value in params.items()
+        if key not in _UNCACHED_PARAMS
+    ))
 
 
 PORTALS = {
@@ -400,7 +483,16 @@ PORTALS = {
 
 class SolarPortal:
 
-    def __init__(self, portal: str, base_url: str=None, client=None):
+    def __init__(self, portal: str, base_url: str=None, client=None,
+                 limit: int=100, limit_per_host: int=10,
+                 ttl_dns_cache: int=300, keepalive_timeout: float=60,
+                 timeout: float=30, connect_timeout: float=10,
+                 lazy_records: bool=False, cache: ResponseCache=None,
+                 coalesce: bool=True, rate_limiter: TokenBucket=None,
+                 retry_policy: RetryPolicy=None, concurrency_limiter: AdaptiveConcurrency=None,
+                 metrics: MetricsRegistry=None, parser: str=None, direct_records: bool=False,
+                 executor: Executor=None, executor_threshold: int=64 * 1024,
+                 skip_unchanged: bool=False):
         self.portal = portal
         if portal == 'manual':
             self._base_url = base_url
@@ -408,39 +500,321 @@ class SolarPortal:
             self._base_url = PORTALS[portal]['base_url']
         self._client = client
 
-    async def _request(self, params: Mapping) -> Dict:
-        args = [key + '=' + urlquote(value, safe='')
-                for key, value in params.items()]
-        url = self._base_url + '&'.join(args)
-        _LOGGER.debug('Getting url: %s', url)
+        # settings for our own pooled session, used when no client is given
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._ttl_dns_cache = ttl_dns_cache
+        self._keepalive_timeout = keepalive_timeout
+        self._timeout = timeout
+        self._connect_timeout = connect_timeout
+        self._session = None
 
-        if self._client:
-            _LOGGER.debug('Getting with client')
-            async with self._client.get(url) as response:
-                status_code = response.status
-                body = await response.text()
-        else:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    status_code = response.status
-                    body = await response.text()
+        # encoded static parameters, by their values
+        self._url_prefixes = {}  # type: Dict[Tuple, str]
 
-        _LOGGER.debug('Got response: %s', status_code)
+        # decode records on first access, instead of at construction
+        self._lazy_records = lazy_records
 
-        if status_code != 200:
-            raise SolarPortalError('Status code not ok: %s' % (status_code, ))
+        # parser backend, fastest available by default; build list records while parsing
+        self._parser = get_backend(parser)
+        self._direct_records = direct_records
 
-        # check for errors
-        xml = ET.fromstring(body)
-        el_status = xml.find('.//status')
-        if el_status is not None and el_status.text != 'true':
-            el_error_code = xml.find('.//errorCode')
-            error_code = el_error_code.text
-            el_error_message = xml.find('.//errorMessage')
-            error_message = el_error_message.text
-            raise SolarPortalError('Error: %s, %s' % (error_code, error_message))
+        # parse responses of at least executor_threshold bytes in a thread or process pool
+        self._executor = executor
+        self._executor_threshold = executor_threshold
+
+        # reuse the previous result when the portal responds 304, or with the same body
+        self._skip_unchanged = skip_unchanged
+        self._last_responses = {}  # type: Dict[Tuple, Tuple[Tuple, bytes, str, str, Dict]]
+
+        # opt-in cache for responses
+        self._cache = cache
+
+        # share results of identical requests which are in flight
+        self._coalesce = coalesce
+        self._in_flight = {}  # type: Dict[Tuple, asyncio.Future]
+
+        # throttling and retrying, share rate_limiter between portals for the same site
+        self._rate_limiter = rate_limiter
+        self._retry_policy = retry_policy
+        self._concurrency_limiter = concurrency_limiter
+
+        # optional instrumentation
+        self._metrics = metrics
+
+        # newest error seen per station, by aiter_errors
+        self._error_marks = {}  # type: Dict[str, datetime]
+
+        # complete station lists, by aiter_powerstations
+        self._station_lists = {}  # type: Dict[Tuple[str, str], Tuple[datetime, List[Powerstation]]]
+
+    @property
+    def base_url(self) -> str:
+        return self._base_url
+
+    async def __aenter__(self) -> 'SolarPortal':
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        await self.aclose()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the client to use, create our own pooled session when needed."""
+        if self._client:
+            return self._client
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                ttl_dns_cache=self._ttl_dns_cache,
+                keepalive_timeout=self._keepalive_timeout)
+            timeout = aiohttp.ClientTimeout(
+                total=self._timeout,
+                sock_connect=self._connect_timeout)
+            trace_configs = [self._create_trace_config()] if self._metrics is not None else None
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                  trace_configs=trace_configs)
+
+        return self._session
+
+    async def aclose(self) -> None:
+        """Close our own session, a client given to us is left untouched."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _records(self, record_class: type, tag: str=None) -> Optional[Tuple[type, str]]:
+        """RecordBuilder arguments when building records while parsing, else None."""
+        return (record_class, tag) if self._direct_records else None
+
+    async def _request(self, params: Mapping, immutable: bool=False, records: Tuple[type, str]=None) -> Dict:
+        cache = self._cache
+        method = params['method']
+        if cache is None or not cache.is_cached(method):
+            return await self._fetch_coalesced(params, records)
+
+        cache_key = _cache_key(params)
+        data = cache.get(cache_key)
+        if data is not None:
+            self._count('cache_hits_total', params)
+            return data
+
+        self._count('cache_misses_total', params)
+        data = await self._fetch_coalesced(params, records)
+
+        last_updated = None
+        if method == 'Data':
+            try:
+                last_updated = float(data['detail']['lastupdated'])
+            except (KeyError, TypeError, ValueError):
+                # missing or empty, cached for the ttl only
+                pass
+        cache.set(cache_key, data, cache.expires_at(method, last_updated, immutable))
+        return data
+
+    async def _fetch_coalesced(self, params: Mapping, records: Tuple[type, str]=None) -> Dict:
+        """Fetch, callers requesting the same while a request is in flight share its result."""
+        if not self._coalesce:
+            return await self._fetch(params, records)
+
+        key = tuple(sorted(params.items()))
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(params, records))
+            self._in_flight[key] = future
+
+            def done(_):
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+            future.add_done_callback(done)
+
+        return await asyncio.shield(future)
+
+    async def _fetch(self, params: Mapping, records: Tuple[type, str]=None) -> Dict:
+        """Fetch, rate limited and retried according to the retry policy."""
+        attempt = 0
+        while True:
+            if self._rate_limiter is not None:
+                await self._rate_limiter.acquire()
+            if self._concurrency_limiter is not None:
+                await self._concurrency_limiter.acquire()
+
+            # released exactly once, whatever the request ends with, the limiter
+            # only lowers its limit for the retryable errors
+            error = None  # type: BaseException
+            try:
+                data = await self._fetch_once(params, records)
+            except BaseException as exc:
+                error = exc
+                if not isinstance(exc, (SolarPortalError, aiohttp.ClientError, asyncio.TimeoutError)):
+                    raise
+
+                self._count('errors_total', params, error=type(exc).__name__)
+                if self._retry_policy is None or not self._retry_policy.should_retry(exc, attempt):
+                    raise
+            finally:
+                if self._concurrency_limiter is not None:
+                    await self._concurrency_limiter.release(error)
+
+            if error is None:
+                return data
+
+            self._count('retries_total', params)
+            delay = self._retry_policy.delay(attempt)
+            _LOGGER.debug('Request failed: %s, retrying in %.1f seconds', error, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _fetch_once(self, params: Mapping, records: Tuple[type, str]=None) -> Dict:
+        try:
+            return await self._fetch_response(params, records)
+        except PARSE_ERRORS as exc:
+            raise SolarPortalParseError('Invalid response: %s' % (exc, )) from exc
+
+    async def _fetch_response(self, params: Mapping, records: Tuple[type, str]=None) -> Dict:
+        url = self._url(params)
+        _LOGGER.debug('Getting: %s', _Redacted(params))
+
+        session = self._get_session()
+        headers = {'Accept-Encoding': 'gzip, deflate'}
+
+        # previous response of this method for this station, sent as validators for the same request
+        slot = previous = None
+        cache_key = None
+        if self._skip_unchanged:
+            slot = (params['method'], params.get('username'), params.get('stationid'))
+            cache_key = _cache_key(params)
+            previous = self._last_responses.get(slot)
+            if previous is not None and previous[0] == cache_key:
+                if previous[2]:
+                    headers['If-None-Match'] = previous[2]
+                if previous[3]:
+                    headers['If-Modified-Since'] = previous[3]
+
+        builder = None
+        body = None
+        timings = {}  # type: Dict[str, float]
+        kwargs = {'trace_request_ctx': timings} if self._metrics is not None else {}
+        size = 0
+        parse_time = 0.0
+        start = time.perf_counter()
+        async with session.get(url, headers=headers, **kwargs) as response:
+            headers_received = time.perf_counter()
+            status_code = response.status
+            _LOGGER.debug('Got response: %s', status_code)
+
+            if status_code == 304 and len(headers) > 1:
+                self._count('not_modified_total', params)
+                return previous[4]
+
+            if status_code != 200:
+                raise SolarPortalHttpError(status_code)
+
+            if self._executor is not None or slot is not None:
+                # complete body, to compare with the previous or to parse in the executor; the
+                # decompressed size decides, the Content-Length is compressed or missing when chunked
+                body = await response.read()
+                size = len(body)
+            else:
+                if records is not None:
+                    builder = RecordBuilder(*records, backend=self._parser)
+                else:
+                    builder = _XmlDictBuilder(backend=self._parser)
+
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    parse_start = time.perf_counter()
+                    builder.feed(chunk)
+                    parse_time += time.perf_counter() - parse_start
+
+        body_received = time.perf_counter()
+        digest = None
+        if builder is not None:
+            data = builder.close()
+            status, error_code, error_message = builder.status, builder.error_code, builder.error_message
+        else:
+            if slot is not None:
+                digest = hashlib.sha1(body).digest()
+            if previous is not None and previous[1] == digest:
+                self._count('unchanged_total', params)
+                data, status, error_code, error_message = previous[4], None, None, None
+            elif self._executor is not None and size >= self._executor_threshold:
+                loop = asyncio.get_event_loop()
+                data, status, error_code, error_message = await loop.run_in_executor(
+                    self._executor, parse_response, body, self._parser, records)
+            else:
+                data, status, error_code, error_message = parse_response(body, self._parser, records)
+        end = time.perf_counter()
+        parse_time += end - body_received
+
+        if self._metrics is not None:
+            labels = {'portal': self.portal, 'method': params['method']}
+            connect = timings.get('connect', 0.0)
+            self._metrics.observe('request_seconds', connect, phase='connect', **labels)
+            self._metrics.observe('request_seconds', headers_received - start - connect, phase='ttfb', **labels)
+            self._metrics.observe('request_seconds', end - headers_received - parse_time, phase='download', **labels)
+            self._metrics.observe('request_seconds', parse_time, phase='parse', **labels)
+            self._metrics.observe('request_seconds', end - start, phase='total', **labels)
+            self._metrics.inc('response_bytes_total', size, **labels)
 
-        return _xml_to_dict(xml)
+        # check for errors
+        if status is not None and status != 'true':
+            raise SolarPortalApiError(error_code, error_message)
+
+        if slot is not None:
+            self._last_responses[slot] = (cache_key, digest, response.headers.get('ETag'),
+                                          response.headers.get('Last-Modified'), data)
+
+        return data
+
+    def _url(self, params: Mapping) -> URL:
+        """Build the URL, the static parameters are encoded once per token."""
+        static = tuple(params.get(name) for name in _STATIC_PARAMS)
+        prefix = self._url_prefixes.get(static)
+        if prefix is None:
+            if len(self._url_prefixes) >= 256:
+                self._url_prefixes.clear()
+            prefix = self._url_prefixes[static] = self._base_url + '&'.join(
+                name + '=' + urlquote(value, safe='')
+                for name, value in zip(_STATIC_PARAMS, static) if value is not None)
+
+        varying = ''.join('&' + name + '=' + urlquote(value, safe='')
+                          for name, value in params.items() if name not in _STATIC_PARAMS)
+        return URL(prefix + varying, encoded=True)
+
+    @staticmethod
+    def _token_params(method: str, token: Token, key: str, **params: str) -> Dict[str, str]:
+        """Parameters of a request with a token."""
+        result = {
+            'method': method,
+            'username': token.username,
+            'token': token.token,
+            'key': key,
+        }
+        result.update(params)
+        return result
+
+    def _count(self, name: str, params: Mapping, **labels: str) -> None:
+        if self._metrics is not None:
+            self._metrics.inc(name, portal=self.portal, method=params['method'], **labels)
+
+    @staticmethod
+    def _create_trace_config() -> aiohttp.TraceConfig:
+        """Trace connection setup, for the connect phase in the metrics."""
+        async def on_connection_create_start(session, context, params):
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx['connect_start'] = time.perf_counter()
+
+        async def on_connection_create_end(session, context, params):
+            timings = context.trace_request_ctx
+            if timings is not None and 'connect_start' in timings:
+                timings['connect'] = time.perf_counter() - timings['connect_start']
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_start.append(on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return trace_config
 
     async def async_login(self, username: str, password: str, key='apitest', client='iPhone') -> Token:
         password_md5 = hashlib.md5(password.encode('utf-8')).hexdigest()
@@ -454,79 +828,230 @@ class SolarPortal:
         data = await self._request(params)
         return Token(data)
 
-    async def async_get_powerstations(self, token: Token, key='apitest') -> List[Powerstation]:
-        params = {
-            'method': 'Powerstationslist',
-            'username': token.username,
-            'token': token.token,
-            'key': key,
-        }
-        data = await self._request(params)
+    async def async_get_powerstations(self, token: Token, key='apitest', page: int=None,
+                                      per_page: int=None) -> List[Powerstation]:
+        params = self._token_params('Powerstationslist', token, key)
+        if page is not None:
+            params['page'] = str(page)
+            params['perPage'] = str(per_page)
+        data = await self._request(params, records=self._records(Powerstation, 'power'))
+        if self._direct_records:
+            return list(data.get('power', []))
 
         # ensure always a list
-        if isinstance(data['power'], dict):
-            data['power'] = [data['power']]
-
-        return [Powerstation(s) for s in data['power']]
+        stations = data.get('power', [])
+        if isinstance(stations, dict):
+            stations = data['power'] = [stations]
+
+        return [Powerstation(s, lazy=self._lazy_records) for s in stations]
+
+    async def aiter_powerstations(self, token: Token, per_page: int=100, concurrency: int=4,
+                                  max_age: timedelta=None, key='apitest') -> AsyncIterator[Powerstation]:
+        """
+        Iterate powerstations, fetching pages concurrently and yielding them as pages arrive.
+
+        The number of pages is determined by async_get_powerstation_count. A complete list
+        is cached, when it is younger than max_age it is used instead of fetching again.
+        """
+        cache_key = (token.username, key)
+        if max_age is not None and cache_key in self._station_lists:
+            fetched, powerstations = self._station_lists[cache_key]
+            if datetime.now() - fetched < max_age:
+                for powerstation in powerstations:
+                    yield powerstation
+                return
+
+        fetched = datetime.now()
+        count = await self.async_get_powerstation_count(token, key=key)
+        pages = (count + per_page - 1) // per_page
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get_page(page):
+            async with semaphore:
+                return await self.async_get_powerstations(token, key=key, page=page, per_page=per_page)
+
+        powerstations = []
+        tasks = [asyncio.ensure_future(get_page(page)) for page in range(1, pages + 1)]
+        try:
+            for next_ in asyncio.as_completed(tasks):
+                for powerstation in await next_:
+                    powerstations.append(powerstation)
+                    yield powerstation
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        self._station_lists[cache_key] = (fetched, powerstations)
 
     async def async_get_powerstation_count(self, token: Token, key='apitest') -> int:
-        params = {
-            'method': 'PowerstationslistCount',
-            'username': token.username,
-            'token': token.token,
-            'key': key,
-        }
+        params = self._token_params('PowerstationslistCount', token, key)
         data = await self._request(params)
 
         return int(data['recordCount'])
 
     async def async_get_data(self, token: Token, powerstation: Powerstation, key='apitest') -> Data:
-        params = {
-            'method': 'Data',
-            'username': token.username,
-            'token': token.token,
-            'key': key,
-            'stationid': powerstation.station_id,
-        }
-        data = await self._request(params)
-        return Data(data)
-
-    async def async_get_graph(self, token: Token, powerstation: Powerstation, now: datetime, type: str, key='apitest') -> Graph:
-        params = {
-            'method': 'Graph',
-            'username': token.username,
-            'token': token.token,
-            'key': key,
-            'stationid': powerstation.station_id,
-            'datetime': now.isoformat(),
-            'type': type,
-        }
-        data = await self._request(params)
-        return Graph(data)
-
-    async def async_get_errors(self, token: Token, powerstation: Powerstation, key='apitest') -> List[Error]:
-        params = {
-            'method': 'Error',
-            'username': token.username,
-            'token': token.token,
-            'key': key,
-            'stationid': powerstation.station_id,
-            'page': '1',
-            'perPage': '1000',
-        }
+        params = self._token_params('Data', token, key, stationid=powerstation.station_id)
         data = await self._request(params)
+        return Data(data, lazy=self._lazy_records)
+
+    async def async_get_graph(self, token: Token, powerstation: Powerstation, now: datetime, type: str,
+                              key='apitest') -> Graph:
+        params = self._token_params('Graph', token, key,
+                                    stationid=powerstation.station_id,
+                                    datetime=now.isoformat(),
+                                    type=type)
+        data = await self._request(params, immutable=_graph_is_final(now, type), records=self._records(Graph))
+        if self._direct_records:
+            return data
+        return Graph(data, lazy=self._lazy_records)
+
+    async def _async_get_errors_page(self, token: Token, powerstation: Powerstation, page: int, per_page: int,
+                                     key: str) -> Tuple[List[Error], int]:
+        """Get a page of errors, and the total number of errors."""
+        params = self._token_params('Error', token, key,
+                                    stationid=powerstation.station_id,
+                                    page=str(page),
+                                    perPage=str(per_page))
+        data = await self._request(params, records=self._records(Error, 'error'))
 
         # ensure always a list
-        if isinstance(data['error'], dict):
-            data['error'] = [data['error']]
-
-        return [Error(e) for e in data['error']]
+        errors = data.get('error', [])
+        if isinstance(errors, dict):
+            errors = data['error'] = [errors]
+
+        total = int(data['errTotal']) if data.get('errTotal') else len(errors)
+        if self._direct_records:
+            return list(errors), total
+        return [Error(e, lazy=self._lazy_records) for e in errors], total
+
+    async def async_get_errors(self, token: Token, powerstation: Powerstation, key='apitest',
+                               page: int=1, per_page: int=1000) -> List[Error]:
+        errors, _ = await self._async_get_errors_page(token, powerstation, page, per_page, key)
+        return errors
+
+    async def aiter_errors(self, token: Token, powerstation: Powerstation, since: datetime=None,
+                           per_page: int=100, key='apitest') -> AsyncIterator[Error]:
+        """
+        Iterate errors of a powerstation, newest first, fetching pages as needed.
+
+        Stops at the first error not newer than since. When since is not given, the newest
+        error of a previous complete iteration for this powerstation is used, so repeated polls
+        only fetch new errors.
+        """
+        station_id = powerstation.station_id
+        if since is None:
+            since = self._error_marks.get(station_id)
+
+        # the mark only moves when all errors up to it are delivered, so an error while
+        # fetching a page, or the caller stopping early, repeats them on the next poll
+        newest = None
+        page = 1
+        while True:
+            errors, total = await self._async_get_errors_page(token, powerstation, page, per_page, key)
+            for error in errors:
+                if since is not None and error.datetime <= since:
+                    self._set_error_mark(station_id, newest)
+                    return
+                if newest is None or error.datetime > newest:
+                    newest = error.datetime
+                yield error
+
+            if not errors or page * per_page >= total:
+                self._set_error_mark(station_id, newest)
+                return
+            page += 1
+
+    def _set_error_mark(self, station_id: str, newest: Optional[datetime]) -> None:
+        if newest is not None and (station_id not in self._error_marks or
+                                   newest > self._error_marks[station_id]):
+            self._error_marks[station_id] = newest
+
+    async def _fan_out(self, func: Callable[[Powerstation], Awaitable],
+                       powerstations: Iterable[Powerstation], concurrency: int) -> List:
+        """Call func for every powerstation, results in order, errors returned instead of raised."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(powerstation):
+            async with semaphore:
+                try:
+                    return await func(powerstation)
+                except FAN_OUT_ERRORS as exc:
+                    return exc
+
+        tasks = [asyncio.ensure_future(run(powerstation)) for powerstation in powerstations]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _fan_out_as_completed(self, func: Callable[[Powerstation], Awaitable],
+                                    powerstations: Iterable[Powerstation], concurrency: int) -> AsyncIterator:
+        """Call func for every powerstation, yield (powerstation, result) as they complete."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(powerstation):
+            async with semaphore:
+                try:
+                    return powerstation, await func(powerstation)
+                except FAN_OUT_ERRORS as exc:
+                    return powerstation, exc
+
+        tasks = [asyncio.ensure_future(run(powerstation)) for powerstation in powerstations]
+        try:
+            for next_ in asyncio.as_completed(tasks):
+                yield await next_
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def async_get_data_many(self, token: Token, powerstations: Iterable[Powerstation],
+                                  concurrency: int=10, key='apitest') -> List[Union[Data, Exception]]:
+        """Get Data for many powerstations concurrently, a failure is returned in place of its Data."""
+        async def func(powerstation):
+            return await self.async_get_data(token, powerstation, key=key)
+        return await self._fan_out(func, powerstations, concurrency)
+
+    def aiter_data_many(self, token: Token, powerstations: Iterable[Powerstation],
+                        concurrency: int=10,
+                        key='apitest') -> AsyncIterator[Tuple[Powerstation, Union[Data, Exception]]]:
+        """Get Data for many powerstations concurrently, yield (powerstation, Data) as they complete."""
+        async def func(powerstation):
+            return await self.async_get_data(token, powerstation, key=key)
+        return self._fan_out_as_completed(func, powerstations, concurrency)
+
+    async def async_get_graph_many(self, token: Token, powerstations: Iterable[Powerstation],
+                                   now: datetime, type: str,
+                                   concurrency: int=10, key='apitest') -> List[Union[Graph, Exception]]:
+        """Get Graph for many powerstations concurrently, a failure is returned in place of its Graph."""
+        async def func(powerstation):
+            return await self.async_get_graph(token, powerstation, now, type, key=key)
+        return await self._fan_out(func, powerstations, concurrency)
+
+    def aiter_graph_many(self, token: Token, powerstations: Iterable[Powerstation],
+                         now: datetime, type: str,
+                         concurrency: int=10,
+                         key='apitest') -> AsyncIterator[Tuple[Powerstation, Union[Graph, Exception]]]:
+        """Get Graph for many powerstations concurrently, yield (powerstation, Graph) as they complete."""
+        async def func(powerstation):
+            return await self.async_get_graph(token, powerstation, now, type, key=key)
+        return self._fan_out_as_completed(func, powerstations, concurrency)
+
+    async def async_get_errors_many(self, token: Token, powerstations: Iterable[Powerstation],
+                                    concurrency: int=10, key='apitest') -> List[Union[List[Error], Exception]]:
+        """Get Errors for many powerstations concurrently, a failure is returned in place of its Errors."""
+        async def func(powerstation):
+            return await self.async_get_errors(token, powerstation, key=key)
+        return await self._fan_out(func, powerstations, concurrency)
+
+    def aiter_errors_many(self, token: Token, powerstations: Iterable[Powerstation],
+                          concurrency: int=10,
+                          key='apitest') -> AsyncIterator[Tuple[Powerstation, Union[List[Error], Exception]]]:
+        """Get Errors for many powerstations concurrently, yield (powerstation, Errors) as they complete."""
+        async def func(powerstation):
+            return await self.async_get_errors(token, powerstation, key=key)
+        return self._fan_out_as_completed(func, powerstations, concurrency)
 
     async def async_logout(self, token: Token, key='apitest') -> None:
-        params = {
-            'method': 'Logout',
-            'username': token.username,
-            'token': token.token,
-            'key': key,
-        }
+        params = self._token_params('Logout', token, key)
         data = await self._request(params)
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""Backfill historical graphs."""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
+from typing import Iterable
+from typing import List
+from typing import Set
+from typing import Tuple
+
+from solarportal import FAN_OUT_ERRORS
+from solarportal import GRAPH_TYPE_DAY
+from solarportal import GRAPH_TYPE_MONTH
+from solarportal import GRAPH_TYPE_YEAR
+from solarportal import Graph
+from solarportal import Powerstation
+from solarportal import SolarPortal
+from solarportal import _graph_is_final
+from solarportal.token_manager import TokenManager
+from solarportal.writers import CsvWriter
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+# resolution of the points -> graph type to request
+RESOLUTIONS = {
+    'intraday': GRAPH_TYPE_DAY,
+    'day': GRAPH_TYPE_MONTH,
+    'month': GRAPH_TYPE_YEAR,
+}
+
+
+def plan(start: date, end: date, resolution: str='intraday') -> List[Tuple[str, datetime]]:
+    """
+    Plan the graph requests covering start up to and including end.
+
+    intraday requests a day graph per day, day a month graph per month and month a
+    year graph per year; the minimum number of requests for the resolution.
+    """
+    graph_type = RESOLUTIONS[resolution]
+    requests = []
+    current = start
+    while current <= end:
+        requests.append((graph_type, datetime(current.year, current.month, current.day)))
+        if graph_type == GRAPH_TYPE_DAY:
+            current += timedelta(days=1)
+        elif graph_type == GRAPH_TYPE_MONTH:
+            current = date(current.year + current.month // 12, current.month % 12 + 1, 1)
+        else:
+            current = date(current.year + 1, 1, 1)
+    return requests
+
+
+class Checkpoint:
+    """
+    Remember which graphs are fetched, persisted to path.
+
+    The file is an append-only log with a key per line, save only appends the graphs
+    marked done since the previous save. Checkpoints saved as a JSON list are converted.
+    """
+
+    def __init__(self, path: str=None):
+        """Initializer."""
+        self._path = path
+        self._done = set()  # type: Set[str]
+        self._pending = []  # type: List[str]
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        with open(self._path, 'r') as fd:
+            content = fd.read()
+
+        if content.startswith('['):
+            self._done = set(json.loads(content))
+            tmp_path = self._path + '.tmp'
+            with open(tmp_path, 'w') as fd:
+                fd.writelines(key + '\n' for key in sorted(self._done))
+            os.replace(tmp_path, self._path)
+            return
+
+        # a line cut off by a crash is not a key
+        lines = content.split('\n')
+        self._done = set(line for line in lines[:-1] if line)
+
+    @staticmethod
+    def _key(station_id: str, graph_type: str, now: datetime) -> str:
+        return '{}|{}|{}'.format(station_id, graph_type, now.strftime('%Y-%m-%d'))
+
+    def is_done(self, station_id: str, graph_type: str, now: datetime) -> bool:
+        return self._key(station_id, graph_type, now) in self._done
+
+    def mark_done(self, station_id: str, graph_type: str, now: datetime) -> None:
+        key = self._key(station_id, graph_type, now)
+        if key not in self._done:
+            self._done.add(key)
+            self._pending.append(key)
+
+    def save(self) -> None:
+        if not self._path or not self._pending:
+            self._pending = []
+            return
+
+        with open(self._path, 'a') as fd:
+            fd.writelines(key + '\n' for key in self._pending)
+            fd.flush()
+            os.fsync(fd.fileno())
+        self._pending = []
+
+
+class GraphStore:
+    """Destination for backfilled graphs."""
+
+    def write_graph(self, station_id: str, graph_type: str, graph: Graph) -> None:
+        """Write the points of a graph."""
+        raise NotImplementedError()
+
+    def flush(self) -> None:
+        """Make written graphs durable."""
+
+    def close(self) -> None:
+        """Flush and release resources."""
+
+
+class CsvGraphStore(GraphStore):
+    """Append graph points to a CSV file: timestamp, station, type and power."""
+
+    HEADER = ('timestamp', 'station', 'type', 'power')
+
+    def __init__(self, path: str, **options):
+        """Initializer."""
+        self._writer = CsvWriter(path, header=self.HEADER, **options)
+
+    def write_graph(self, station_id: str, graph_type: str, graph: Graph) -> None:
+        for timestamp, power in zip(graph.timestamps, graph.powers):
+            self._writer.write((int(timestamp), station_id, graph_type, power))
+
+    def flush(self) -> None:
+        self._writer.flush()
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+class Backfill:
+    """
+    Fetch historical graphs for many powerstations concurrently.
+
+    Graphs are fetched by concurrency workers. Graphs which are fetched before and cover
+    a period which has passed are skipped, progress is appended to the checkpoint every
+    save_every graphs, so a backfill can be resumed after a crash. Rate limiting is done
+    by the portal, see SolarPortal.
+    """
+
+    def __init__(self, portal: SolarPortal, tokens: TokenManager, username: str, password: str,
+                 store: GraphStore, checkpoint: Checkpoint=None, concurrency: int=10,
+                 save_every: int=100):
+        """Initializer."""
+        self._portal = portal
+        self._tokens = tokens
+        self._username = username
+        self._password = password
+        self._store = store
+        self._checkpoint = checkpoint or Checkpoint()
+        self._concurrency = concurrency
+        self._save_every = save_every
+        self._unsaved = 0
+        self.fetched = 0
+        self.skipped = 0
+        self.failed = 0
+
+    async def async_run(self, powerstations: Iterable[Powerstation], start: date, end: date,
+                        resolution: str='intraday') -> None:
+        """Backfill graphs for powerstations, from start up to and including end."""
+        requests = plan(start, end, resolution)
+
+        # jobs are fed to a fixed number of workers, never more than a few are pending
+        queue = asyncio.Queue(maxsize=2 * self._concurrency)  # type: asyncio.Queue
+        tasks = [asyncio.ensure_future(self._async_produce(queue, powerstations, requests))]
+        tasks += [asyncio.ensure_future(self._async_work(queue)) for _ in range(self._concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._save()
+
+    async def _async_produce(self, queue: asyncio.Queue, powerstations: Iterable[Powerstation],
+                             requests: List[Tuple[str, datetime]]) -> None:
+        for powerstation in powerstations:
+            for graph_type, now in requests:
+                if self._checkpoint.is_done(powerstation.station_id, graph_type, now):
+                    self.skipped += 1
+                    continue
+                await queue.put((powerstation, graph_type, now))
+
+        for _ in range(self._concurrency):
+            await queue.put(None)
+
+    async def _async_work(self, queue: asyncio.Queue) -> None:
+        while True:
+            job = await queue.get()
+            if job is None:
+                return
+            await self._async_fetch(*job)
+
+    def _save(self) -> None:
+        # graphs must be stored before they are marked done
+        self._unsaved = 0
+        self._store.flush()
+        self._checkpoint.save()
+
+    async def _async_fetch(self, powerstation: Powerstation, graph_type: str, now: datetime) -> None:
+        try:
+            graph = await self._tokens.async_call(
+                self._portal, self._username, self._password,
+                lambda token: self._portal.async_get_graph(token, powerstation, now, graph_type))
+        except FAN_OUT_ERRORS as exc:
+            _LOGGER.warning('Error fetching graph %s/%s/%s: %s', powerstation.station_id,
+                            graph_type, now.date(), exc)
+            self.failed += 1
+            return
+
+        # a graph which can not be stored fails this job only, it is retried on resume
+        try:
+            self._store.write_graph(powerstation.station_id, graph_type, graph)
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception('Error storing graph %s/%s/%s', powerstation.station_id,
+                              graph_type, now.date())
+            self.failed += 1
+            return
+
+        self.fetched += 1
+
+        # only graphs which will not change anymore are done
+        if _graph_is_final(now, graph_type):
+            self._checkpoint.mark_done(powerstation.station_id, graph_type, now)
+            self._unsaved += 1
+            if self._unsaved >= self._save_every:
+                self._save()
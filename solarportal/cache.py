@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Response cache for Solarportal API."""
+
+import time
+from collections import OrderedDict
+from typing import Callable
+from typing import Hashable
+from typing import Mapping
+from typing import Optional
+
+
+DEFAULT_TTLS = {
+    'Powerstationslist': 300,
+    'PowerstationslistCount': 300,
+    'Data': 60,
+    'Graph': 300,
+    'Error': 60,
+}
+
+
+class ResponseCache:
+    """
+    LRU cache for parsed portal responses, with a time to live per method.
+
+    Only methods with a TTL are cached. Entries without an expiry never expire,
+    but can still be evicted when the cache is full.
+    """
+
+    def __init__(self, max_size: int=1024, ttls: Mapping[str, float]=None,
+                 upload_interval: float=300, clock: Callable[[], float]=time.time):
+        """Initializer."""
+        self._max_size = max_size
+        self._ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self._upload_interval = upload_interval
+        self._clock = clock
+        self._entries = OrderedDict()  # type: OrderedDict
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_cached(self, method: str) -> bool:
+        """Test if responses for method are cached."""
+        return method in self._ttls
+
+    def expires_at(self, method: str, last_updated: float=None, immutable: bool=False) -> Optional[float]:
+        """
+        Get the expiry time for a response.
+
+        When the portal last updated the data at last_updated, no new data is expected
+        until last_updated + upload_interval. Immutable responses never expire.
+        """
+        if immutable:
+            return None
+
+        expires = self._clock() + self._ttls[method]
+        if last_updated is not None:
+            expires = max(expires, last_updated + self._upload_interval)
+        return expires
+
+    def get(self, key: Hashable):
+        """Get a cached response, or None."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires = entry
+            if expires is None or expires > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+            del self._entries[key]
+
+        self.misses += 1
+        return None
+
+    def set(self, key: Hashable, value, expires: Optional[float]) -> None:
+        """Store a response, until expires."""
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all responses."""
+        self._entries.clear()
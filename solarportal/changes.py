@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Change detection for polled results."""
+
+import asyncio
+import statistics
+from collections import deque
+from datetime import datetime
+from datetime import timedelta
+from typing import AsyncIterator
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+
+from solarportal import Powerstation
+
+
+def last_updated(result) -> datetime:
+    """Get when the portal last updated result, a Data or Powerstation."""
+    if isinstance(result, Powerstation):
+        return result.last_time
+    return result.last_updated
+
+
+class ChangeTracker:
+    """
+    Track the last update seen per station, to skip unchanged results.
+
+    From the history of updates the next update of a station is predicted, so a
+    station can be polled just after new data lands instead of on a fixed interval.
+    """
+
+    def __init__(self, history: int=10, margin: timedelta=timedelta(seconds=30),
+                 default_interval: timedelta=timedelta(minutes=5)):
+        """Initializer."""
+        self._history = history
+        self._margin = margin
+        self._default_interval = default_interval
+        self._updates = {}  # type: Dict[str, deque]
+
+    def last_seen(self, station_id: str) -> Optional[datetime]:
+        """Get the last update seen for a station."""
+        updates = self._updates.get(station_id)
+        return updates[-1] if updates else None
+
+    def update(self, station_id: str, updated: datetime) -> bool:
+        """Record an update of a station, return True if it is new."""
+        updates = self._updates.setdefault(station_id, deque(maxlen=self._history))
+        if updates and updated <= updates[-1]:
+            return False
+
+        updates.append(updated)
+        return True
+
+    def interval(self, station_id: str) -> timedelta:
+        """Get the median interval between updates of a station."""
+        updates = self._updates.get(station_id)
+        if not updates or len(updates) < 2:
+            return self._default_interval
+
+        return statistics.median(b - a for a, b in zip(updates, list(updates)[1:]))
+
+    def predict_next(self, station_id: str, now: datetime=None) -> Optional[datetime]:
+        """Predict the first update of a station after now, None if never seen."""
+        last = self.last_seen(station_id)
+        if last is None:
+            return None
+
+        now = now or datetime.now()
+        interval = self.interval(station_id)
+        next_ = last + interval
+        if next_ < now:
+            # updates were missed, e.g. at night, keep the phase of the updates
+            next_ += interval * ((now - next_) // interval + 1)
+        return next_
+
+    def next_poll(self, station_id: str, now: datetime=None) -> datetime:
+        """Get when to poll a station, just after its next predicted update."""
+        now = now or datetime.now()
+        next_ = self.predict_next(station_id, now)
+        if next_ is None:
+            return now
+        return next_ + self._margin
+
+    def _is_change(self, powerstation: Powerstation, result) -> bool:
+        # failures are passed on, as by the *_many methods
+        if isinstance(result, Exception):
+            return True
+        return self.update(powerstation.station_id, last_updated(result))
+
+    def filter(self, results: Iterable[Tuple[Powerstation, object]]) -> Iterator[Tuple[Powerstation, object]]:
+        """Yield only (powerstation, result) with new results, a Data or Powerstation."""
+        for powerstation, result in results:
+            if self._is_change(powerstation, result):
+                yield powerstation, result
+
+    async def afilter(self, results: AsyncIterator[Tuple[Powerstation, object]]) \
+            -> AsyncIterator[Tuple[Powerstation, object]]:
+        """Yield only (powerstation, result) with new results, e.g. from SolarPortal.aiter_data_many."""
+        async for powerstation, result in results:
+            if self._is_change(powerstation, result):
+                yield powerstation, result
+
+    async def aiter_poll(self, station_id: str, poll: Callable[[], Awaitable]) -> AsyncIterator:
+        """Poll a station just after its predicted updates, yield only new results."""
+        while True:
+            now = datetime.now()
+            delay = (self.next_poll(station_id, now) - now).total_seconds()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            result = await poll()
+            if self.update(station_id, last_updated(result)):
+                yield result
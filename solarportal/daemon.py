@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""Polling daemon for many accounts and powerstations."""
+
+import asyncio
+import functools
+import json
+import logging
+import zlib
+from datetime import datetime
+from datetime import timedelta
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Sequence
+from typing import Tuple
+
+import aiohttp
+
+from solarportal import Powerstation
+from solarportal import SolarPortal
+from solarportal import SolarPortalError
+from solarportal.changes import ChangeTracker
+from solarportal.ratelimit import RetryPolicy
+from solarportal.sinks import Sink
+from solarportal.sinks import create_sink
+from solarportal.token_manager import TokenManager
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def ceil_datetime(dt: datetime, delta: timedelta) -> datetime:
+    """Round dt up to a multiple of delta."""
+    return dt + (datetime.min - dt) % delta
+
+
+def station_offset(station_key: str, spread: timedelta) -> timedelta:
+    """Get a stable offset within spread for a station, to spread requests."""
+    spread_seconds = int(spread.total_seconds())
+    if spread_seconds <= 0:
+        return timedelta()
+
+    return timedelta(seconds=zlib.crc32(station_key.encode('utf-8')) % spread_seconds)
+
+
+class Account:
+    """Account on a portal, polled every interval."""
+
+    def __init__(self, portal: str, username: str, password: str,
+                 interval: timedelta=timedelta(minutes=5), stations: Sequence[str]=None,
+                 base_url: str=None):
+        """Initializer."""
+        self.portal = portal
+        self.username = username
+        self.password = password
+        self.interval = interval
+        self.stations = stations
+        self.base_url = base_url
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> 'Account':
+        return cls(config['portal'], config['username'], config['password'],
+                   interval=timedelta(minutes=config.get('interval', 5)),
+                   stations=config.get('stations'),
+                   base_url=config.get('base_url'))
+
+
+class Daemon:
+    """
+    Poll all powerstations of many accounts and write results to sinks.
+
+    Every powerstation is polled on its own interval, aligned to the interval and
+    offset by a stable amount within spread. With predict, a powerstation is polled
+    just after its next update is expected instead. Portals are shared between
+    accounts on the same portal, results are written to all sinks concurrently.
+    Accounts are started independently, listing the powerstations of an account is
+    retried with the delays of retry_policy until it succeeds.
+    With changes_only, results the portal did not update since the previous poll
+    are not written.
+    """
+
+    def __init__(self, accounts: List[Account], sinks: List[Sink],
+                 spread: timedelta=timedelta(minutes=1), tokens: TokenManager=None,
+                 portal_factory: Callable[[Account], SolarPortal]=None,
+                 changes_only: bool=True, predict: bool=False, retry_policy: RetryPolicy=None):
+        """Initializer."""
+        self._accounts = accounts
+        self._sinks = sinks
+        self._spread = spread
+        self._changes = ChangeTracker() if changes_only or predict else None
+        self._changes_only = changes_only
+        self._predict = predict
+        self._tokens = tokens or TokenManager()
+        self._portal_factory = portal_factory or self._create_portal
+        self._portals = {}  # type: Dict[Tuple[str, str], SolarPortal]
+        self._retry_policy = retry_policy or RetryPolicy(base_delay=30, max_delay=900)
+
+    @classmethod
+    def from_config(cls, config: Mapping) -> 'Daemon':
+        """Create from a config, as loaded by load_config."""
+        accounts = [Account.from_config(account) for account in config['accounts']]
+        sinks = [create_sink(sink) for sink in config.get('sinks', [])]
+        spread = timedelta(seconds=config.get('spread', 60))
+        tokens = TokenManager(path=config.get('token_cache'))
+        return cls(accounts, sinks, spread=spread, tokens=tokens,
+                   changes_only=config.get('changes_only', True), predict=config.get('predict', False))
+
+    @staticmethod
+    def _create_portal(account: Account) -> SolarPortal:
+        return SolarPortal(account.portal, base_url=account.base_url)
+
+    def portal(self, account: Account) -> SolarPortal:
+        """Get the portal for account, shared with other accounts on the same portal."""
+        key = (account.portal, account.base_url)
+        if key not in self._portals:
+            self._portals[key] = self._portal_factory(account)
+        return self._portals[key]
+
+    async def async_get_powerstations(self, account: Account) -> List[Powerstation]:
+        """Get the powerstations to poll for account."""
+        portal = self.portal(account)
+        powerstations = await self._tokens.async_call(
+            portal, account.username, account.password, portal.async_get_powerstations)
+        if account.stations is not None:
+            powerstations = [p for p in powerstations if p.station_id in account.stations]
+        return powerstations
+
+    @staticmethod
+    def _station_key(account: Account, powerstation: Powerstation) -> str:
+        return '{}/{}/{}'.format(account.portal, account.username, powerstation.station_id)
+
+    async def async_poll(self, account: Account, powerstation: Powerstation, timestamp: datetime) -> None:
+        """Poll a powerstation once and write the result to all sinks."""
+        portal = self.portal(account)
+        data = await self._tokens.async_call(
+            portal, account.username, account.password,
+            lambda token: portal.async_get_data(token, powerstation))
+
+        updated = getattr(data, 'last_updated', None)
+        if self._changes is not None and updated is not None:
+            is_new = self._changes.update(self._station_key(account, powerstation), updated)
+            if self._changes_only and not is_new:
+                _LOGGER.debug('No new data for %s', powerstation)
+                return
+
+        results = await asyncio.gather(*[
+            sink.async_write(powerstation, timestamp, data)
+            for sink in self._sinks
+        ], return_exceptions=True)
+        for sink, result in zip(self._sinks, results):
+            if isinstance(result, Exception):
+                _LOGGER.warning('Error writing to %s: %s', sink, result)
+
+    async def _async_run_station(self, account: Account, powerstation: Powerstation) -> None:
+        key = self._station_key(account, powerstation)
+        offset = station_offset(key, min(self._spread, account.interval))
+        while True:
+            now = datetime.now()
+            if self._predict and self._changes.last_seen(key) is not None:
+                next_ = self._changes.next_poll(key, now)
+                await asyncio.sleep((next_ - now).total_seconds())
+            else:
+                next_ = ceil_datetime(now - offset, account.interval)
+                await asyncio.sleep((next_ + offset - now).total_seconds())
+
+            try:
+                await self.async_poll(account, powerstation, next_)
+            except (SolarPortalError, aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                _LOGGER.warning('Error polling %s: %s', key, exc)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception('Unexpected error polling %s', key)
+
+            # ensure we don't poll twice in the same interval
+            await asyncio.sleep(1)
+
+    @staticmethod
+    def _station_stopped(key: str, task: asyncio.Future) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.error('Stopped polling %s', key, exc_info=task.exception())
+
+    async def _async_run_account(self, account: Account) -> None:
+        attempt = 0
+        while True:
+            try:
+                powerstations = await self.async_get_powerstations(account)
+                break
+            except Exception as exc:  # pylint: disable=broad-except
+                delay = self._retry_policy.delay(attempt)
+                _LOGGER.warning('Error getting powerstations for %s: %s, retrying in %.1f seconds',
+                                account.username, exc, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+        _LOGGER.info('Polling %s powerstations for %s', len(powerstations), account.username)
+        tasks = []
+        try:
+            for powerstation in powerstations:
+                task = asyncio.ensure_future(self._async_run_station(account, powerstation))
+                task.add_done_callback(functools.partial(
+                    self._station_stopped, self._station_key(account, powerstation)))
+                tasks.append(task)
+            # a station which stops polling must not stop the others
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def async_run(self) -> None:
+        """Poll all powerstations of all accounts, until cancelled."""
+        tasks = [asyncio.ensure_future(self._async_run_account(account)) for account in self._accounts]
+        try:
+            # an account which fails must not stop the others
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close all portals and sinks."""
+        for portal in self._portals.values():
+            await portal.aclose()
+        for sink in self._sinks:
+            await sink.aclose()
+
+
+def load_config(filename: str) -> Dict:
+    """Load a JSON config file."""
+    with open(filename, 'r') as fd:
+        return json.load(fd)
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Fleet wide aggregation of powerstation results."""
+
+import heapq
+import math
+from array import array
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from typing import Union
+
+from solarportal import Data
+from solarportal import Powerstation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+COLUMNS = ('actual_power', 'etoday', 'etotal', 'today_income', 'total_income', 'capacity')
+
+# group by levels, each level is a key of the regions up to and including it
+LEVELS = ('country', 'province', 'city')
+
+
+def _percentile(values: Sequence[float], percent: float) -> float:
+    """Percentile of sorted values, interpolated linearly between the closest ranks."""
+    position = (len(values) - 1) * percent / 100.0
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+class FleetAggregator:
+    """
+    Aggregate the latest results of all powerstations of a fleet.
+
+    The values of each station are kept in columns, one array per value. Sums per country,
+    province and city are updated incrementally when the result of a station is updated,
+    so totals are never recomputed from all stations. Percentiles and underperformers are
+    computed from the columns, vectorized with numpy when it is installed.
+
+    The capacity factor is the actual power (W) relative to the capacity (kWp).
+    """
+
+    def __init__(self):
+        """Initializer."""
+        self._columns = {name: array('d') for name in COLUMNS}  # type: Dict[str, array]
+        self._station_ids = []  # type: List[str]
+        self._regions = []  # type: List[Tuple[str, str, str]]
+        self._rows = {}  # type: Dict[str, int]
+
+        # level (None for the fleet) -> group key -> [count, sum per column]
+        self._groups = {level: {} for level in (None, ) + LEVELS}  # type: Dict[Optional[str], Dict[Tuple, List]]
+
+    def __len__(self):
+        return len(self._station_ids)
+
+    def __contains__(self, station_id: str):
+        return station_id in self._rows
+
+    def update(self, powerstation: Powerstation, data: Data=None) -> None:
+        """Update the values of a station, from its Data when given, else from the Powerstation."""
+        values = []
+        for name in COLUMNS:
+            value = getattr(data, name, None) if data is not None else None
+            if value is None:
+                value = getattr(powerstation, name, None)
+            values.append(float(value) if value is not None else 0.0)
+        region = tuple(self._region(powerstation, data, name) for name in LEVELS)
+
+        station_id = powerstation.station_id
+        row = self._rows.get(station_id)
+        if row is None:
+            # columns first, the bookkeeping is only changed once they are written
+            for name, value in zip(COLUMNS, values):
+                self._columns[name].append(value)
+            row = self._rows[station_id] = len(self._station_ids)
+            self._station_ids.append(station_id)
+            self._regions.append(region)
+        else:
+            self._add_to_groups(row, -1)
+            self._regions[row] = region
+            for name, value in zip(COLUMNS, values):
+                self._columns[name][row] = value
+
+        self._add_to_groups(row, 1)
+
+    def update_many(self, results: Iterable[Tuple[Powerstation, Union[Data, Exception]]]) -> None:
+        """Update from (powerstation, Data) pairs, as yielded by aiter_data_many, failures are skipped."""
+        for powerstation, data in results:
+            if not isinstance(data, Exception):
+                self.update(powerstation, data)
+
+    def remove(self, station_id: str) -> None:
+        """Remove a station, the last station takes its row."""
+        row = self._rows[station_id]
+        self._add_to_groups(row, -1)
+
+        last = len(self._station_ids) - 1
+        for column in self._columns.values():
+            column[row] = column[last]
+            column.pop()
+
+        del self._rows[station_id]
+        if row != last:
+            self._station_ids[row] = self._station_ids[last]
+            self._regions[row] = self._regions[last]
+            self._rows[self._station_ids[row]] = row
+        self._station_ids.pop()
+        self._regions.pop()
+
+    @staticmethod
+    def _region(powerstation: Powerstation, data: Optional[Data], name: str) -> str:
+        value = getattr(data, name, None) if data is not None else None
+        if not value:
+            value = getattr(powerstation, name, None)
+        return value or ''
+
+    def _add_to_groups(self, row: int, sign: int) -> None:
+        values = [self._columns[name][row] for name in COLUMNS]
+        region = self._regions[row]
+        for depth, level in enumerate((None, ) + LEVELS):
+            groups = self._groups[level]
+            key = region[:depth]
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0] + [0.0] * len(COLUMNS)
+            group[0] += sign
+            if group[0] == 0:
+                del groups[key]
+                continue
+
+            for index, value in enumerate(values, 1):
+                group[index] += sign * value
+
+    def totals(self, level: str=None) -> Dict[Tuple, Dict[str, float]]:
+        """
+        Sums per group of level (country, province or city), by key of regions up to level.
+
+        Without level, the totals of the fleet are returned under the key (). Besides the
+        sums of the values, stations is the number of stations and capacity_factor the
+        fleet capacity factor of the group.
+        """
+        if level is not None and level not in LEVELS:
+            raise ValueError('Unknown level: %s' % level)
+
+        result = {}
+        for key, group in self._groups[level].items():
+            totals = dict(zip(COLUMNS, group[1:]))
+            totals['stations'] = group[0]
+            capacity = totals['capacity']
+            totals['capacity_factor'] = totals['actual_power'] / (capacity * 1000) if capacity else None
+            result[key] = totals
+        return result
+
+    def column(self, name: str):
+        """Get a copy of the values of a column, a numpy array when numpy is installed."""
+        if numpy is not None:
+            return self._view(name).copy()
+        return array('d', self._columns[name])
+
+    def _view(self, name: str):
+        """Numpy array sharing memory with a column, only valid until the next update."""
+        return numpy.frombuffer(self._columns[name], dtype=numpy.float64)
+
+    def percentiles(self, name: str, percents: Sequence[float]=(5, 50, 95)) -> Dict[float, float]:
+        """Percentiles of the values in column name, over all stations."""
+        if not self._station_ids:
+            return {}
+
+        if numpy is not None:
+            values = numpy.percentile(self._view(name), percents)
+            return {percent: float(value) for percent, value in zip(percents, values)}
+
+        values = sorted(self._columns[name])
+        return {percent: _percentile(values, percent) for percent in percents}
+
+    def capacity_factors(self) -> Dict[str, float]:
+        """Capacity factor by station, for stations with a known capacity."""
+        power, capacity = self._columns['actual_power'], self._columns['capacity']
+        return {
+            station_id: power[row] / (capacity[row] * 1000)
+            for row, station_id in enumerate(self._station_ids) if capacity[row]
+        }
+
+    def underperformers(self, count: int=10) -> List[Tuple[str, float]]:
+        """The count stations with the lowest capacity factor, as (station_id, capacity factor)."""
+        if numpy is not None:
+            power, capacity = self._view('actual_power'), self._view('capacity')
+            rows = numpy.flatnonzero(capacity)
+            factors = power[rows] / (capacity[rows] * 1000)
+            if count < len(rows):
+                lowest = numpy.argpartition(factors, count)[:count]
+            else:
+                lowest = numpy.arange(len(rows))
+            lowest = lowest[numpy.argsort(factors[lowest], kind='stable')]
+            return [(self._station_ids[rows[index]], float(factors[index])) for index in lowest]
+
+        return heapq.nsmallest(count, self.capacity_factors().items(), key=lambda item: item[1])
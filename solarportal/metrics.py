@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Performance metrics for Solarportal API."""
+
+import bisect
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Mapping
+from typing import Sequence
+from typing import Tuple
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Histogram of observed values, with cumulative buckets."""
+
+    def __init__(self, buckets: Sequence[float]=DEFAULT_BUCKETS):
+        """Initializer."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> List[int]:
+        result = []
+        total = 0
+        for count in self.counts:
+            total += count
+            result.append(total)
+        return result
+
+
+def _labels(labels: Mapping[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...]=()) -> str:
+    items = labels + extra
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, _escape(value))
+                          for key, value in items) + '}'
+
+
+class MetricsRegistry:
+    """
+    Registry of histograms and counters, by name and labels.
+
+    Listeners are called with (name, labels, value) for every observation and
+    increment, to forward metrics elsewhere. to_prometheus renders all metrics in
+    the Prometheus text format.
+    """
+
+    def __init__(self, prefix: str='solarportal_', buckets: Sequence[float]=DEFAULT_BUCKETS):
+        """Initializer."""
+        self._prefix = prefix
+        self._buckets = buckets
+        self.histograms = {}  # type: Dict[str, Dict[Labels, Histogram]]
+        self.counters = {}  # type: Dict[str, Dict[Labels, float]]
+        self._listeners = []  # type: List[Callable[[str, Mapping[str, str], float], None]]
+
+    def add_listener(self, listener: Callable[[str, Mapping[str, str], float], None]) -> None:
+        self._listeners.append(listener)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """Observe a value in the histogram name."""
+        histograms = self.histograms.setdefault(name, {})
+        key = _labels(labels)
+        if key not in histograms:
+            histograms[key] = Histogram(self._buckets)
+        histograms[key].observe(value)
+        for listener in self._listeners:
+            listener(name, labels, value)
+
+    def inc(self, name: str, amount: float=1, **labels: str) -> None:
+        """Increment the counter name."""
+        counters = self.counters.setdefault(name, {})
+        key = _labels(labels)
+        counters[key] = counters.get(key, 0) + amount
+        for listener in self._listeners:
+            listener(name, labels, amount)
+
+    def to_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        lines = []
+        for name, histograms in sorted(self.histograms.items()):
+            full_name = self._prefix + name
+            lines.append('# TYPE {} histogram'.format(full_name))
+            for labels, histogram in sorted(histograms.items()):
+                for bound, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                    lines.append('{}_bucket{} {}'.format(full_name, _format_labels(labels, (('le', repr(bound)), )),
+                                                         count))
+                lines.append('{}_bucket{} {}'.format(full_name, _format_labels(labels, (('le', '+Inf'), )),
+                                                     histogram.count))
+                lines.append('{}_sum{} {}'.format(full_name, _format_labels(labels), repr(histogram.sum)))
+                lines.append('{}_count{} {}'.format(full_name, _format_labels(labels), histogram.count))
+
+        for name, counters in sorted(self.counters.items()):
+            full_name = self._prefix + name
+            lines.append('# TYPE {} counter'.format(full_name))
+            for labels, value in sorted(counters.items()):
+                lines.append('{}{} {}'.format(full_name, _format_labels(labels), value))
+
+        return '\n'.join(lines) + '\n'
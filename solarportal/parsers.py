@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""XML parsing for Solarportal API, with pluggable parser backends."""
+
+import xml.etree.ElementTree as ET
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+
+# backend name -> pull parser class, all with the XMLPullParser interface
+BACKENDS = {
+    'stdlib': ET.XMLPullParser,
+}  # type: Dict[str, Callable]
+if lxml_etree is not None:
+    BACKENDS['lxml'] = lxml_etree.XMLPullParser
+
+DEFAULT_BACKEND = 'lxml' if 'lxml' in BACKENDS else 'stdlib'
+
+# errors raised by the backends for a body which is not well-formed XML
+PARSE_ERRORS = (ET.ParseError, )  # type: Tuple[type, ...]
+if lxml_etree is not None:
+    PARSE_ERRORS += (lxml_etree.ParseError, )
+
+
+def get_backend(name: str=None) -> str:
+    """Get the name of the backend to use, the fastest available when name is None."""
+    if name is None:
+        return DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError('Parser backend not available: %s' % name)
+    return name
+
+
+def _xml_add_value(result: Dict, key: str, value) -> None:
+    """Add value to result, repeated keys are collected in a list."""
+    if key not in result:
+        result[key] = value
+    elif isinstance(result[key], list):
+        result[key].append(value)
+    else:
+        result[key] = [result[key], value]
+
+
+def _xml_to_dict(el: ET.Element) -> Dict:
+    """Convert XML to Dict."""
+    result = {}
+    for el_child in el:
+        if len(el_child):
+            value = _xml_to_dict(el_child)
+        else:
+            value = el_child.text or ''
+        _xml_add_value(result, el_child.tag, value)
+    return result
+
+
+class XmlDictBuilder:
+    """
+    Incrementally convert XML to Dict, in a single pass.
+
+    Produces the same result as _xml_to_dict, while the first status, errorCode and
+    errorMessage (in document order) are picked up during parsing.
+    """
+
+    _CHECKED_TAGS = ('status', 'errorCode', 'errorMessage')
+
+    def __init__(self, backend: str=None):
+        """Initializer."""
+        self._parser = BACKENDS[get_backend(backend)](events=('start', 'end'))
+        self._stack = []  # type: List[Optional[Dict]]
+        self._checked = {}  # type: Dict[str, ET.Element]
+        self.result = None  # type: Dict
+        self.status = None  # type: str
+        self.error_code = None  # type: str
+        self.error_message = None  # type: str
+
+    def feed(self, data: bytes) -> None:
+        """Feed a chunk of XML."""
+        self._parser.feed(data)
+        self._read_events()
+
+    def close(self) -> Dict:
+        """Finish parsing, return the resulting Dict."""
+        self._parser.close()
+        self._read_events()
+        return self.result
+
+    def _read_events(self) -> None:
+        # children of the open elements, None until the first child ends
+        stack = self._stack
+        for event, el in self._parser.read_events():
+            tag = el.tag
+            if event == 'start':
+                stack.append(None)
+                if tag in self._CHECKED_TAGS and tag not in self._checked:
+                    self._checked[tag] = el
+                continue
+
+            children = stack.pop()
+            if self._checked.get(tag) is el:
+                self._set_checked(tag, el.text)
+
+            if not stack:
+                self.result = children or {}
+                continue
+
+            if stack[-1] is None:
+                stack[-1] = {}
+            _xml_add_value(stack[-1], tag, children or el.text or '')
+            el.clear()
+
+    def _set_checked(self, tag: str, text: str) -> None:
+        if tag == 'status':
+            self.status = text
+        elif tag == 'errorCode':
+            self.error_code = text
+        else:
+            self.error_message = text
+
+
+class RecordBuilder(XmlDictBuilder):
+    """
+    Build records straight from parse events, without a Dict per record.
+
+    Elements tagged tag below the root become records of record_class, collected in a list
+    under tag in the resulting Dict. When tag is None the root element is the record, and
+    close returns the record. When a record ends, only the elements of its fields are read.
+    """
+
+    def __init__(self, record_class, tag: str=None, backend: str=None):
+        """Initializer."""
+        super().__init__(backend=backend)
+        self._record_class = record_class
+        self._tag = tag
+        self._record_depth = 1 if tag is None else 2
+        self._depth = 0
+        self._lookup = self._create_lookup(record_class)
+        self.records = []  # type: List
+
+    @staticmethod
+    def _create_lookup(record_class) -> Dict:
+        """Nested lookup of fields, tag -> (field name, None) or (None, lookup of children)."""
+        lookup = {}  # type: Dict[str, Tuple[Optional[str], Optional[Dict]]]
+        for name, (path, _, _) in record_class._FIELDS.items():
+            level = lookup
+            for tag in path[:-1]:
+                level = level.setdefault(tag, (None, {}))[1]
+            level[path[-1]] = (name, None)
+        return lookup
+
+    def _collect(self, el, lookup: Dict, values: Dict) -> None:
+        for child in el:
+            entry = lookup.get(child.tag)
+            if entry is None:
+                continue
+
+            name, children = entry
+            if name is None:
+                self._collect(child, children, values)
+            else:
+                _xml_add_value(values, name, _xml_to_dict(child) if len(child) else (child.text or ''))
+
+    def _read_events(self) -> None:
+        record_depth = self._record_depth
+        for event, el in self._parser.read_events():
+            tag = el.tag
+            if event == 'start':
+                self._depth += 1
+                if tag in self._CHECKED_TAGS and tag not in self._checked:
+                    self._checked[tag] = el
+                continue
+
+            depth = self._depth
+            self._depth = depth - 1
+            if self._checked.get(tag) is el:
+                self._set_checked(tag, el.text)
+
+            if depth > record_depth:
+                # read with its record, or with its child of the root
+                continue
+
+            if depth == record_depth and (self._tag is None or tag == self._tag):
+                values = {}  # type: Dict
+                self._collect(el, self._lookup, values)
+                record = self._record_class._from_fields(values)
+                self.records.append(record)
+                if depth == 1:
+                    self.result = record
+                    continue
+
+                if self.result is None:
+                    self.result = {}
+                self.result.setdefault(tag, []).append(record)
+                el.clear()
+            elif depth == 2:
+                if self.result is None:
+                    self.result = {}
+                _xml_add_value(self.result, tag, _xml_to_dict(el) if len(el) else (el.text or ''))
+                el.clear()
+            elif self.result is None:
+                self.result = {}
+
+
+def parse(body: bytes, backend: str=None) -> Dict:
+    """Parse a complete response to Dict."""
+    builder = XmlDictBuilder(backend=backend)
+    builder.feed(body)
+    return builder.close()
+
+
+def parse_response(body: bytes, backend: str=None, records: Tuple=None) -> Tuple:
+    """
+    Parse a complete response, returns (result, status, error code, error message).
+
+    Builds records as RecordBuilder when records is given as (record_class, tag). A module level
+    function, so it can run in a process pool as well.
+    """
+    if records is not None:
+        builder = RecordBuilder(*records, backend=backend)  # type: XmlDictBuilder
+    else:
+        builder = XmlDictBuilder(backend=backend)
+    builder.feed(body)
+    return builder.close(), builder.status, builder.error_code, builder.error_message
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Batched uploads to PVOutput."""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable
+from typing import List
+
+import aiohttp
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class PVOutputUploader:
+    """
+    Queue statuses for a PVOutput system and upload them in batches.
+
+    Up to BATCH_SIZE statuses are sent per addbatchstatus.jsp request, and no more
+    than requests_per_hour requests are made. Failed uploads stay queued and are
+    retried later, with exponential backoff. When path is given, the queue is
+    persisted so it survives restarts.
+    """
+
+    URL = 'https://pvoutput.org/service/r2/addbatchstatus.jsp'
+    BATCH_SIZE = 30
+
+    def __init__(self, api_key: str, system_id: str, path: str=None,
+                 requests_per_hour: int=60, session=None, url: str=URL,
+                 max_backoff: float=3600, clock: Callable[[], float]=time.time):
+        """Initializer."""
+        self._api_key = api_key
+        self._system_id = system_id
+        self._path = path
+        self._requests_per_hour = requests_per_hour
+        self._client = session
+        self._session = None
+        self._url = url
+        self._max_backoff = max_backoff
+        self._clock = clock
+        self._requests = deque()  # type: deque
+        self._failures = 0
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        self.queue = []  # type: List[List]
+
+        if path and os.path.exists(path):
+            with open(path, 'r') as fd:
+                self.queue = json.load(fd)
+
+    def add_status(self, timestamp: datetime, energy: float, power: float) -> None:
+        """Queue a status: energy generated today in Wh and power in W."""
+        self.queue.append([timestamp.strftime('%Y%m%d'), timestamp.strftime('%H:%M'), energy, power])
+        self._save()
+
+    def _save(self) -> None:
+        if not self._path:
+            return
+
+        tmp_path = self._path + '.tmp'
+        with open(tmp_path, 'w') as fd:
+            json.dump(self.queue, fd)
+        os.replace(tmp_path, self._path)
+
+    def _get_session(self):
+        if self._client:
+            return self._client
+
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    def _request_allowed(self) -> bool:
+        now = self._clock()
+        while self._requests and self._requests[0] <= now - 3600:
+            self._requests.popleft()
+        return now >= self._blocked_until and len(self._requests) < self._requests_per_hour
+
+    def _back_off(self, delay: float=None) -> None:
+        if delay is None:
+            self._failures += 1
+            delay = min(self._max_backoff, 2 ** self._failures)
+        self._blocked_until = self._clock() + delay
+
+    async def async_upload(self) -> int:
+        """Upload queued statuses, as far as allowed, return the number of statuses sent."""
+        async with self._lock:
+            uploaded = 0
+            while self.queue and self._request_allowed():
+                batch = self.queue[:self.BATCH_SIZE]
+                if not await self._async_upload_batch(batch):
+                    break
+
+                del self.queue[:len(batch)]
+                self._save()
+                uploaded += len(batch)
+            return uploaded
+
+    async def _async_upload_batch(self, batch: List[List]) -> bool:
+        headers = {
+            'X-Pvoutput-Apikey': self._api_key,
+            'X-Pvoutput-SystemId': self._system_id,
+        }
+        payload = {
+            'data': ';'.join(','.join(str(value) for value in status) for status in batch),
+        }
+
+        self._requests.append(self._clock())
+        try:
+            async with self._get_session().post(self._url, headers=headers, data=payload) as response:
+                status_code = response.status
+                body = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            _LOGGER.debug('Error uploading to PVOutput: %s', exc)
+            self._back_off()
+            return False
+
+        _LOGGER.debug('PVOutput response: %s, %s', status_code, body)
+        if status_code == 200:
+            self._failures = 0
+            return True
+
+        if status_code == 400:
+            # statuses are invalid, e.g. too old, drop them instead of retrying forever
+            _LOGGER.warning('PVOutput rejected statuses: %s, dropped: %s', body, batch)
+            return True
+
+        if status_code == 403 and 'Exceeded' in body:
+            # quota used up, wait for the hour to pass
+            self._back_off(3600)
+        else:
+            # e.g. an invalid api key or a server error, keep the statuses until it is fixed
+            _LOGGER.warning('Error uploading to PVOutput: %s, %s', status_code, body)
+            self._back_off()
+        return False
+
+    async def aclose(self) -> None:
+        """Close our own session, a session given to us is left untouched."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Rate limiting and retrying for Solarportal API."""
+
+import asyncio
+import random
+import time
+from typing import Callable
+from typing import Dict
+
+import aiohttp
+
+
+# HTTP status codes indicating the portal is overloaded or throttling
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Test if a request which failed with exc can be retried.
+
+    Timeouts, connection errors and overloaded/throttling responses are retryable.
+    Errors reported by the portal itself, such as authorization errors, are fatal.
+    """
+    if isinstance(exc, (asyncio.TimeoutError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return True
+
+    status = getattr(exc, 'status', None)
+    return status in RETRYABLE_STATUS_CODES
+
+
+class TokenBucket:
+    """Token bucket rate limiter, allows rate requests per second with bursts up to burst."""
+
+    def __init__(self, rate: float, burst: int=1, clock: Callable[[], float]=time.monotonic):
+        """Initializer."""
+        self._rate = rate
+        self._burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a request is allowed."""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+                self._refill()
+            self._tokens -= 1
+
+
+_PORTAL_RATE_LIMITERS = {}  # type: Dict[str, TokenBucket]
+
+
+def portal_rate_limiter(portal: str, rate: float, burst: int=1) -> TokenBucket:
+    """Get the TokenBucket shared by everyone using portal, created on first use."""
+    if portal not in _PORTAL_RATE_LIMITERS:
+        _PORTAL_RATE_LIMITERS[portal] = TokenBucket(rate, burst)
+    return _PORTAL_RATE_LIMITERS[portal]
+
+
+class RetryPolicy:
+    """Retry retryable errors, with exponential backoff and full jitter."""
+
+    def __init__(self, attempts: int=3, base_delay: float=0.5, max_delay: float=30,
+                 jitter: bool=True, retryable: Callable[[BaseException], bool]=is_retryable):
+        """Initializer."""
+        self.attempts = attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self._retryable = retryable
+
+    def should_retry(self, exc: BaseException, attempt: int) -> bool:
+        """Test if attempt (counting from 0) failed with exc should be retried."""
+        return attempt + 1 < self.attempts and self._retryable(exc)
+
+    def delay(self, attempt: int) -> float:
+        """Get the delay before retrying attempt (counting from 0)."""
+        delay = min(self._max_delay, self._base_delay * 2 ** attempt)
+        if self._jitter:
+            return random.uniform(0, delay)
+        return delay
+
+
+class AdaptiveConcurrency:
+    """
+    Limit the number of concurrent requests, adapted with AIMD.
+
+    Every successful request raises the limit by increase / limit, so roughly by
+    increase per round of requests. A retryable error multiplies the limit by decrease.
+    """
+
+    def __init__(self, initial: int=4, minimum: int=1, maximum: int=64,
+                 increase: float=1, decrease: float=0.5):
+        """Initializer."""
+        self._limit = float(initial)
+        self._minimum = minimum
+        self._maximum = maximum
+        self._increase = increase
+        self._decrease = decrease
+        self._active = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    async def acquire(self) -> None:
+        """Wait until a request is allowed."""
+        async with self._condition:
+            while self._active >= self.limit:
+                await self._condition.wait()
+            self._active += 1
+
+    async def release(self, exc: BaseException=None) -> None:
+        """Release a request, which failed with exc, if given."""
+        async with self._condition:
+            self._active -= 1
+            if exc is None:
+                self._limit = min(self._maximum, self._limit + self._increase / self._limit)
+            elif is_retryable(exc):
+                self._limit = max(self._minimum, self._limit * self._decrease)
+            self._condition.notify_all()
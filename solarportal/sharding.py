@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""Sweep many powerstations from a pool of worker processes."""
+
+import asyncio
+import multiprocessing
+import pickle
+import queue as queue_module
+import time
+from datetime import datetime
+from typing import AsyncIterator
+from typing import Dict
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+from solarportal import Powerstation
+from solarportal import SolarPortal
+from solarportal import SolarPortalError
+from solarportal import Token
+from solarportal.ratelimit import TokenBucket
+
+
+def shard(items: Sequence, count: int) -> List[Sequence]:
+    """Split items in count shards of (nearly) equal size, empty shards are left out."""
+    return [items[index::count] for index in range(count) if items[index::count]]
+
+
+def _picklable(value):
+    """Get value, or a SolarPortalError describing it when it can not be pickled."""
+    if not isinstance(value, BaseException):
+        return value
+
+    try:
+        pickle.loads(pickle.dumps(value))
+    except Exception:  # pylint: disable=broad-except
+        return SolarPortalError('%s: %s' % (type(value).__name__, value))
+    return value
+
+
+async def _async_run_shard(options: Dict, results) -> None:
+    rate_limiter = None
+    if options['rate'] is not None:
+        rate_limiter = TokenBucket(options['rate'], options['burst'])
+
+    portal = SolarPortal(options['portal'], rate_limiter=rate_limiter, **options['portal_options'])
+    token = Token(options['token'], options['token_created'])
+    powerstations = [Powerstation({'stationID': station_id}) for station_id in options['station_ids']]
+    aiter_many = getattr(portal, 'aiter_{}_many'.format(options['method']))
+
+    batch = []  # type: List[Tuple[str, object]]
+    flushed = time.monotonic()
+    try:
+        async for powerstation, result in aiter_many(token, powerstations, *options['args'],
+                                                     concurrency=options['concurrency']):
+            batch.append((powerstation.station_id, _picklable(result)))
+            if len(batch) >= options['batch_size'] or time.monotonic() - flushed >= options['flush_interval']:
+                results.put(('results', batch))
+                batch = []
+                flushed = time.monotonic()
+
+        if batch:
+            results.put(('results', batch))
+    finally:
+        await portal.aclose()
+
+
+def _run_shard(options: Dict, results) -> None:
+    """Entry point of a worker process, runs its own event loop."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(_async_run_shard(options, results))
+    except Exception as exc:  # pylint: disable=broad-except
+        results.put(('failed', '%s: %s' % (type(exc).__name__, exc)))
+    else:
+        results.put(('done', None))
+    finally:
+        loop.close()
+
+
+class ShardedSweep:
+    """
+    Sweep powerstations from a pool of worker processes, to use more than one CPU core.
+
+    Powerstations are split over processes workers, each running its own SolarPortal and
+    event loop with a token acquired by the parent. The rate (requests per second) and burst
+    are split evenly over the workers. Results are sent back in batches of batch_size, or
+    after flush_interval seconds, instead of a message per powerstation.
+
+    portal_options are passed to SolarPortal in the workers, and must be picklable.
+    """
+
+    def __init__(self, portal: str, token: Token, processes: int=None,
+                 rate: float=None, burst: int=10, concurrency: int=10,
+                 batch_size: int=100, flush_interval: float=0.5,
+                 portal_options: Dict=None, context=None):
+        """Initializer."""
+        self._portal = portal
+        self._token = token
+        self._processes = processes or multiprocessing.cpu_count()
+        self._rate = rate
+        self._burst = burst
+        self._concurrency = concurrency
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._portal_options = portal_options or {}
+        self._context = context or multiprocessing.get_context('spawn')
+
+    def aiter_data(self, powerstations: Sequence[Powerstation]) -> AsyncIterator:
+        """Get Data for all powerstations, yield (powerstation, Data) as batches arrive."""
+        return self._aiter('data', powerstations)
+
+    def aiter_graph(self, powerstations: Sequence[Powerstation], now: datetime, type: str) -> AsyncIterator:
+        """Get Graph for all powerstations, yield (powerstation, Graph) as batches arrive."""
+        return self._aiter('graph', powerstations, now, type)
+
+    def aiter_errors(self, powerstations: Sequence[Powerstation]) -> AsyncIterator:
+        """Get Errors for all powerstations, yield (powerstation, Errors) as batches arrive."""
+        return self._aiter('errors', powerstations)
+
+    def _options(self, method: str, station_ids: Sequence[str], args: Tuple, shards: int) -> Dict:
+        return {
+            'portal': self._portal,
+            'portal_options': self._portal_options,
+            'token': dict(self._token._data),
+            'token_created': self._token.created,
+            'method': method,
+            'args': args,
+            'station_ids': list(station_ids),
+            'rate': self._rate / shards if self._rate is not None else None,
+            'burst': max(1, self._burst // shards),
+            'concurrency': self._concurrency,
+            'batch_size': self._batch_size,
+            'flush_interval': self._flush_interval,
+        }
+
+    async def _aiter(self, method: str, powerstations: Sequence[Powerstation], *args) -> AsyncIterator:
+        by_id = {powerstation.station_id: powerstation for powerstation in powerstations}
+        shards = shard(list(by_id), self._processes)
+        if not shards:
+            return
+
+        results = self._context.Queue()
+        processes = [
+            self._context.Process(target=_run_shard,
+                                  args=(self._options(method, station_ids, args, len(shards)), results),
+                                  daemon=True)
+            for station_ids in shards
+        ]
+        for process in processes:
+            process.start()
+
+        loop = asyncio.get_event_loop()
+        running = len(processes)
+        try:
+            while running:
+                kind, payload = await loop.run_in_executor(None, self._get, results, processes)
+                if kind == 'done':
+                    running -= 1
+                elif kind == 'failed':
+                    raise SolarPortalError('Worker failed: %s' % (payload, ))
+                else:
+                    for station_id, result in payload:
+                        yield by_id[station_id], result
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+                process.join()
+            results.close()
+
+    @staticmethod
+    def _get(results, processes) -> Tuple[str, object]:
+        """Get the next message, raises when all workers have exited without a message."""
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue_module.Empty:
+                if any(process.is_alive() for process in processes):
+                    continue
+
+            try:
+                return results.get(timeout=1)
+            except queue_module.Empty:
+                raise SolarPortalError('Workers exited unexpectedly')
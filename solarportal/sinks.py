@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""Sinks for polled results."""
+
+import asyncio
+import logging
+import os.path
+from datetime import datetime
+from datetime import timedelta
+from typing import Callable
+from typing import Dict
+from typing import Mapping
+
+import aiohttp
+
+from solarportal import Data
+from solarportal import Powerstation
+from solarportal.pvoutput import PVOutputUploader
+from solarportal.store import TimeSeriesStore
+from solarportal.writers import CSV_HEADER
+from solarportal.writers import BinaryLogWriter
+from solarportal.writers import CsvWriter
+from solarportal.writers import ParquetWriter
+from solarportal.writers import data_row
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Sink:
+    """Destination for polled data."""
+
+    async def async_write(self, powerstation: Powerstation, timestamp: datetime, data: Data) -> None:
+        """Write data for powerstation, sampled at timestamp."""
+        raise NotImplementedError()
+
+    async def aclose(self) -> None:
+        """Flush and release resources."""
+
+
+class _WriterSink(Sink):
+    """Write data through a buffered writer, which is also flushed every flush_interval seconds."""
+
+    def __init__(self, writer, flush_interval: float):
+        """Initializer."""
+        self._writer = writer
+        self._flush_interval = flush_interval
+        self._flusher = None
+
+    async def async_write(self, powerstation: Powerstation, timestamp: datetime, data: Data) -> None:
+        if self._flusher is None:
+            self._flusher = asyncio.ensure_future(self._async_flush_periodically())
+
+        self._write(powerstation, timestamp, data)
+
+    def _write(self, powerstation: Powerstation, timestamp: datetime, data: Data) -> None:
+        self._writer.write(data_row(timestamp, powerstation, data))
+
+    async def _async_flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            self._writer.flush()
+
+    async def aclose(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        self._writer.close()
+
+
+class CsvSink(_WriterSink):
+    """Append data to CSV files, use - for stdout. Options are passed to CsvWriter."""
+
+    HEADER = ';'.join(CSV_HEADER)
+
+    def __init__(self, output: str, flush_interval: float=30, **options):
+        """Initializer."""
+        super().__init__(CsvWriter(output, flush_interval=flush_interval, **options), flush_interval)
+
+
+class BinaryLogSink(_WriterSink):
+    """Append data to binary log files. Options are passed to BinaryLogWriter."""
+
+    def __init__(self, output: str, flush_interval: float=30, **options):
+        """Initializer."""
+        super().__init__(BinaryLogWriter(output, flush_interval=flush_interval, **options), flush_interval)
+
+
+class ParquetSink(_WriterSink):
+    """Write data to Parquet files. Options are passed to ParquetWriter."""
+
+    def __init__(self, output: str, flush_interval: float=30, **options):
+        """Initializer."""
+        super().__init__(ParquetWriter(output, flush_interval=flush_interval, **options), flush_interval)
+
+
+class StoreSink(_WriterSink):
+    """
+    Add data to a local TimeSeriesStore. Options are passed to TimeSeriesStore.
+
+    Retention is given in days per resolution, None to keep forever.
+    """
+
+    def __init__(self, output: str, flush_interval: float=30, **options):
+        """Initializer."""
+        if 'retention' in options:
+            options['retention'] = {
+                resolution: timedelta(days=days) if days is not None else None
+                for resolution, days in options['retention'].items()
+            }
+        super().__init__(TimeSeriesStore(output, **options), flush_interval)
+
+    def _write(self, powerstation: Powerstation, timestamp: datetime, data: Data) -> None:
+        self._writer.add_data(powerstation, timestamp, data)
+
+
+class PVOutputSink(Sink):
+    """
+    Upload data to PVOutput, systems maps station ids to PVOutput system ids.
+
+    Statuses are queued and uploaded in batches, with queue_dir the queues are
+    persisted so statuses are not lost when PVOutput can not be reached.
+    """
+
+    def __init__(self, api_key: str, systems: Mapping[str, str],
+                 requests_per_hour: int=60, queue_dir: str=None):
+        """Initializer."""
+        self._api_key = api_key
+        self._systems = systems
+        self._requests_per_hour = requests_per_hour
+        self._queue_dir = queue_dir
+        self._session = None
+        self._uploaders = {}  # type: Dict[str, PVOutputUploader]
+
+    def _uploader(self, system_id: str) -> PVOutputUploader:
+        if system_id not in self._uploaders:
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            path = None
+            if self._queue_dir:
+                path = os.path.join(self._queue_dir, 'pvoutput-{}.json'.format(system_id))
+            self._uploaders[system_id] = PVOutputUploader(
+                self._api_key, system_id, path=path,
+                requests_per_hour=self._requests_per_hour, session=self._session)
+        return self._uploaders[system_id]
+
+    async def async_write(self, powerstation: Powerstation, timestamp: datetime, data: Data) -> None:
+        system_id = self._systems.get(powerstation.station_id)
+        if system_id is None:
+            return
+
+        uploader = self._uploader(system_id)
+        uploader.add_status(timestamp, data.energy_today * 1000, data.actual_power)
+        await uploader.async_upload()
+
+    async def aclose(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+SINK_TYPES = {
+    'csv': CsvSink,
+    'binary': BinaryLogSink,
+    'parquet': ParquetSink,
+    'sqlite': StoreSink,
+    'pvoutput': PVOutputSink,
+}  # type: Dict[str, Callable[..., Sink]]
+
+
+def create_sink(config: Mapping) -> Sink:
+    """Create a sink from config, type selects the sink, other keys are passed as arguments."""
+    config = dict(config)
+    sink_type = config.pop('type')
+    return SINK_TYPES[sink_type](**config)
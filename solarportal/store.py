@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Local time-series store for polled samples."""
+
+import sqlite3
+import time
+from datetime import datetime
+from datetime import timedelta
+from typing import Callable
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+from solarportal import GRAPH_TYPE_DAY
+from solarportal import Data
+from solarportal import Graph
+from solarportal import Powerstation
+from solarportal.backfill import GraphStore
+
+
+# table per resolution, rolled up from the previous one
+TABLES = {
+    'raw': 'samples',
+    'hour': 'samples_hourly',
+    'day': 'samples_daily',
+}
+
+# length of the buckets of a resolution, in seconds
+BUCKET_SECONDS = {
+    'hour': 3600,
+    'day': 86400,
+}
+
+DEFAULT_RETENTION = {
+    'raw': timedelta(days=14),
+    'hour': timedelta(days=365),
+    'day': None,
+}
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS samples (
+    station TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    power REAL,
+    etoday REAL,
+    etotal REAL,
+    PRIMARY KEY (station, timestamp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS samples_hourly (
+    station TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    power_avg REAL,
+    power_max REAL,
+    etoday REAL,
+    count INTEGER,
+    PRIMARY KEY (station, timestamp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS samples_daily (
+    station TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    power_avg REAL,
+    power_max REAL,
+    etoday REAL,
+    count INTEGER,
+    PRIMARY KEY (station, timestamp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS totals (
+    station TEXT NOT NULL,
+    type TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    value REAL,
+    PRIMARY KEY (station, type, timestamp)
+) WITHOUT ROWID;
+'''
+
+# recompute a bucket of a station from the resolution below it
+_ROLLUP = {
+    'hour': '''
+        INSERT OR REPLACE INTO samples_hourly
+        SELECT station, :start, AVG(power), MAX(power), MAX(etoday), COUNT(*)
+        FROM samples WHERE station = :station AND timestamp >= :start AND timestamp < :end
+        GROUP BY station''',
+    'day': '''
+        INSERT OR REPLACE INTO samples_daily
+        SELECT station, :start, SUM(power_avg * count) / SUM(count), MAX(power_max), MAX(etoday), SUM(count)
+        FROM samples_hourly WHERE station = :station AND timestamp >= :start AND timestamp < :end
+        GROUP BY station''',
+}
+
+
+class TimeSeriesStore(GraphStore):
+    """
+    Local time-series store in SQLite, indexed by (station, timestamp).
+
+    Samples are inserted in batches of batch_size. When flushed, the hourly and daily
+    buckets (UTC) of the stations which received samples are rolled up, and samples
+    older than the retention of their resolution are removed. A bucket rolled up
+    before is not recomputed once retention removed some of its source rows. Day
+    graphs are stored as samples, the points of other graphs as totals.
+    """
+
+    def __init__(self, path: str, batch_size: int=500,
+                 retention: Mapping[str, timedelta]=None, clock: Callable[[], float]=time.time):
+        """Initializer."""
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(_SCHEMA)
+        self._batch_size = batch_size
+        self._retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self._clock = clock
+        self._samples = []  # type: List[Tuple]
+        self._totals = []  # type: List[Tuple]
+        self._dirty_hours = set()  # type: Set[Tuple[str, int]]
+
+    def add_sample(self, station_id: str, timestamp: int, power: float,
+                   etoday: float=None, etotal: float=None) -> None:
+        """Add a sample, flushed when a batch is complete."""
+        self._samples.append((station_id, timestamp, power, etoday, etotal))
+        self._dirty_hours.add((station_id, timestamp // 3600 * 3600))
+        if len(self._samples) >= self._batch_size:
+            self.flush()
+
+    def add_data(self, powerstation: Powerstation, timestamp: datetime, data: Data) -> None:
+        """Add polled data as a sample."""
+        self.add_sample(powerstation.station_id, int(timestamp.timestamp()),
+                        data.actual_power, data.etoday, data.etotal)
+
+    def write_graph(self, station_id: str, graph_type: str, graph: Graph) -> None:
+        if graph_type == GRAPH_TYPE_DAY:
+            for timestamp, power in zip(graph.timestamps, graph.powers):
+                self.add_sample(station_id, int(timestamp), power)
+            return
+
+        self._totals += [
+            (station_id, graph_type, int(timestamp), value)
+            for timestamp, value in zip(graph.timestamps, graph.powers)
+        ]
+        if len(self._totals) >= self._batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Insert pending samples, roll up and apply retention."""
+        with self._connection:
+            if self._samples:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?)', self._samples)
+                self._samples = []
+            if self._totals:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO totals VALUES (?, ?, ?, ?)', self._totals)
+                self._totals = []
+            self._rollup()
+            self._apply_retention()
+
+    def _rollup(self) -> None:
+        hours = self._rollup_buckets('hour', self._dirty_hours)
+        self._rollup_buckets('day', {(station_id, hour // 86400 * 86400) for station_id, hour in hours})
+        self._dirty_hours = set()
+
+    def _rollup_buckets(self, resolution: str, buckets: Set[Tuple[str, int]]) -> List[Tuple[str, int]]:
+        """Recompute the (station, start) buckets of resolution, returns the recomputed buckets."""
+        # source rows before the cutoff may be removed, only their rollup is complete then
+        cutoff = self._cutoff('raw' if resolution == 'hour' else 'hour')
+        table = TABLES[resolution]
+        recompute = [
+            (station_id, start) for station_id, start in sorted(buckets)
+            if cutoff is None or start >= cutoff or self._connection.execute(
+                'SELECT 1 FROM {} WHERE station = ? AND timestamp = ?'.format(table),
+                (station_id, start)).fetchone() is None
+        ]
+        size = BUCKET_SECONDS[resolution]
+        self._connection.executemany(_ROLLUP[resolution], [
+            {'station': station_id, 'start': start, 'end': start + size}
+            for station_id, start in recompute
+        ])
+        return recompute
+
+    def _cutoff(self, resolution: str) -> Optional[int]:
+        """Get the timestamp before which rows of resolution are removed, None when kept forever."""
+        retention = self._retention[resolution]
+        if retention is None:
+            return None
+        return int(self._clock() - retention.total_seconds())
+
+    def _apply_retention(self) -> None:
+        for resolution in self._retention:
+            cutoff = self._cutoff(resolution)
+            if cutoff is None:
+                continue
+
+            self._connection.execute(
+                'DELETE FROM {} WHERE timestamp < ?'.format(TABLES[resolution]), (cutoff, ))
+
+    def query(self, station_id: str, start: datetime, end: datetime, resolution: str='raw') -> List[Tuple]:
+        """
+        Get samples of a station from start up to end.
+
+        Raw rows are (timestamp, power, etoday, etotal), hour and day rows are
+        (timestamp, power_avg, power_max, etoday, count).
+        """
+        columns = 'timestamp, power, etoday, etotal' if resolution == 'raw' else \
+            'timestamp, power_avg, power_max, etoday, count'
+        cursor = self._connection.execute(
+            'SELECT {} FROM {} WHERE station = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp'.format(
+                columns, TABLES[resolution]),
+            (station_id, int(start.timestamp()), int(end.timestamp())))
+        return cursor.fetchall()
+
+    def query_totals(self, station_id: str, graph_type: str, start: datetime, end: datetime) -> List[Tuple]:
+        """Get (timestamp, value) of graph points of graph_type from start up to end."""
+        cursor = self._connection.execute(
+            'SELECT timestamp, value FROM totals '
+            'WHERE station = ? AND type = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+            (station_id, graph_type, int(start.timestamp()), int(end.timestamp())))
+        return cursor.fetchall()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
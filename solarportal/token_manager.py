@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Token management for Solarportal API."""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from datetime import timedelta
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+
+from solarportal import SolarPortal
+from solarportal import SolarPortalApiError
+from solarportal import Token
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TokenManager:
+    """
+    Cache tokens per (portal, username).
+
+    Tokens are refreshed before they expire and only a single login per (portal, username)
+    is in flight at a time, other callers wait for its result. Optionally tokens are
+    persisted to path, to survive restarts.
+    """
+
+    def __init__(self, ttl: timedelta=timedelta(hours=1),
+                 refresh_margin: timedelta=timedelta(minutes=5), path: str=None):
+        """Initializer."""
+        self._ttl = ttl
+        self._refresh_margin = refresh_margin
+        self._path = path
+        self._tokens = {}  # type: Dict[Tuple[str, str], Token]
+        self._logins = {}  # type: Dict[Tuple[str, str], asyncio.Future]
+
+        if path and os.path.exists(path):
+            self._load()
+
+    def _key(self, portal: SolarPortal, username: str) -> Tuple[str, str]:
+        return (portal.base_url, username)
+
+    def _is_fresh(self, token: Token) -> bool:
+        return datetime.now() < token.created + self._ttl - self._refresh_margin
+
+    async def async_get_token(self, portal: SolarPortal, username: str, password: str,
+                              force: bool=False) -> Token:
+        """Get a cached token, or login when there is no fresh token."""
+        key = self._key(portal, username)
+        token = self._tokens.get(key)
+        if token is not None and not force and self._is_fresh(token):
+            return token
+
+        future = self._logins.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._async_login(key, portal, username, password))
+            self._logins[key] = future
+
+            def done(_):
+                if self._logins.get(key) is future:
+                    del self._logins[key]
+            future.add_done_callback(done)
+
+        return await asyncio.shield(future)
+
+    async def _async_login(self, key: Tuple[str, str], portal: SolarPortal,
+                           username: str, password: str) -> Token:
+        _LOGGER.debug('Logging in: %s', username)
+        token = await portal.async_login(username=username, password=password)
+        self._tokens[key] = token
+        if self._path:
+            self._save()
+        return token
+
+    def invalidate(self, portal: SolarPortal, username: str, token: Token=None) -> None:
+        """Forget the cached token, only when it still is token, if given."""
+        key = self._key(portal, username)
+        if token is None or self._tokens.get(key) is token:
+            self._tokens.pop(key, None)
+
+    async def async_call(self, portal: SolarPortal, username: str, password: str,
+                         func: Callable[[Token], Awaitable]):
+        """Call func with a token, when the portal reports an error login again and retry once."""
+        token = await self.async_get_token(portal, username, password)
+        try:
+            return await func(token)
+        except SolarPortalApiError as exc:
+            _LOGGER.debug('Request failed, logging in again: %s', exc)
+            self.invalidate(portal, username, token)
+
+        token = await self.async_get_token(portal, username, password)
+        return await func(token)
+
+    def _load(self) -> None:
+        with open(self._path, 'r') as fd:
+            stored = json.load(fd)
+
+        for entry in stored:
+            key = (entry['base_url'], entry['username'])
+            created = datetime.fromtimestamp(entry['created'])
+            self._tokens[key] = Token(entry['data'], created=created)
+
+    def _save(self) -> None:
+        stored = [
+            {
+                'base_url': key[0],
+                'username': key[1],
+                'created': token.created.timestamp(),
+                'data': token._data,
+            }
+            for key, token in self._tokens.items()
+        ]
+
+        tmp_path = self._path + '.tmp'
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as fd:
+            json.dump(stored, fd)
+        os.replace(tmp_path, self._path)
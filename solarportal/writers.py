@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""Buffered writers for polled results."""
+
+import os
+import struct
+import sys
+import time
+from datetime import datetime
+from typing import Callable
+from typing import Iterator
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+from solarportal import Data
+from solarportal import Powerstation
+
+
+COLUMNS = ('timestamp', 'station', 'actual_power', 'today_income', 'total_income', 'etoday', 'etotal')
+CSV_HEADER = ('timestamp', 'station', 'ActualPower', 'TodayIncome', 'TotalIncome', 'etoday', 'etotal')
+
+
+def data_row(timestamp: datetime, powerstation: Powerstation, data: Data) -> Tuple:
+    """Get the row, in COLUMNS order, for data of powerstation sampled at timestamp."""
+    return (
+        int(timestamp.timestamp()),
+        powerstation.station_id,
+        data.actual_power,
+        data.today_income,
+        data.total_income,
+        data.etoday,
+        data.etotal,
+    )
+
+
+class _RotatingWriter:
+    """
+    Buffer rows and write them in batches to a rotating file.
+
+    Rows are flushed when flush_rows rows are buffered, or when a row is written
+    flush_interval seconds after the previous flush. With rotate='daily' a file per
+    day is written, with max_bytes a new file is started when a file grows too large.
+    Files are named path-YYYY-MM-DD.N.ext, leaving out the parts which are not used.
+    """
+
+    def __init__(self, path: str, flush_rows: int=100, flush_interval: float=30,
+                 rotate: str=None, max_bytes: int=None, clock: Callable[[], float]=time.time):
+        """Initializer."""
+        if rotate not in (None, 'daily'):
+            raise ValueError('Unknown rotation: %s' % (rotate, ))
+
+        self._path = path
+        self._flush_rows = flush_rows
+        self._flush_interval = flush_interval
+        self._rotate = rotate
+        self._max_bytes = max_bytes
+        self._clock = clock
+        self._buffer = []  # type: List[Sequence]
+        self._flushed = clock()
+        self._fd = None
+        self._day = None
+        self._sequence = 0
+        self.filename = None
+
+    def write(self, row: Sequence) -> None:
+        """Buffer a row, flush when due."""
+        self._buffer.append(row)
+        if len(self._buffer) >= self._flush_rows or \
+           self._clock() - self._flushed >= self._flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write all buffered rows."""
+        self._flushed = self._clock()
+        if not self._buffer:
+            return
+
+        rows = self._buffer
+        self._buffer = []
+        self._rotate_if_needed()
+        self._write_rows(rows)
+
+    def close(self) -> None:
+        """Flush and close the file."""
+        self.flush()
+        if self._fd is not None:
+            self._close()
+            self._fd = None
+
+    def _filename(self) -> str:
+        base, ext = os.path.splitext(self._path)
+        if self._rotate == 'daily':
+            base += '-' + self._day
+        if self._sequence:
+            base += '.{}'.format(self._sequence)
+        return base + ext
+
+    def _rotate_if_needed(self) -> None:
+        day = datetime.fromtimestamp(self._clock()).strftime('%Y-%m-%d')
+        if self._fd is not None:
+            if self._rotate == 'daily' and day != self._day:
+                self._sequence = 0
+            elif self._max_bytes is not None and self._size() >= self._max_bytes:
+                self._sequence += 1
+            else:
+                return
+            self._close()
+
+        self._day = day
+        self.filename = self._filename()
+        self._open(self.filename)
+        while self._max_bytes is not None and self._size() >= self._max_bytes:
+            # continue after files written earlier
+            self._close()
+            self._sequence += 1
+            self.filename = self._filename()
+            self._open(self.filename)
+
+    def _size(self) -> int:
+        return self._fd.tell()
+
+    def _open(self, filename: str) -> None:
+        raise NotImplementedError()
+
+    def _write_rows(self, rows: List[Sequence]) -> None:
+        raise NotImplementedError()
+
+    def _close(self) -> None:
+        self._fd.close()
+
+
+class CsvWriter(_RotatingWriter):
+    """Buffered CSV writer, use - as path for stdout."""
+
+    def __init__(self, path: str, header: Sequence[str]=CSV_HEADER, separator: str=';', **kwargs):
+        """Initializer."""
+        super().__init__(path, **kwargs)
+        self._header = header
+        self._separator = separator
+
+    def _rotate_if_needed(self) -> None:
+        if self._path == '-':
+            if self._fd is None:
+                self._fd = sys.stdout
+                self._fd.write(self._separator.join(self._header) + '\n')
+            return
+
+        super()._rotate_if_needed()
+
+    def _open(self, filename: str) -> None:
+        self._fd = open(filename, 'ta')
+        if self._fd.tell() == 0:
+            self._fd.write(self._separator.join(self._header) + '\n')
+
+    def _write_rows(self, rows: List[Sequence]) -> None:
+        separator = self._separator
+        self._fd.write(''.join(separator.join(str(value) for value in row) + '\n' for row in rows))
+        self._fd.flush()
+
+    def _close(self) -> None:
+        if self._fd is not sys.stdout:
+            self._fd.close()
+
+
+# record: length of station id, timestamp, station id, values
+_BINARY_HEADER = struct.Struct('<Hq')
+_BINARY_VALUES = struct.Struct('<ddddq')
+
+
+class BinaryLogWriter(_RotatingWriter):
+    """
+    Buffered writer of a compact binary append log.
+
+    Every record holds the timestamp, station id, actual_power, today_income,
+    total_income, etoday and etotal. Read back with read_binary_log.
+    """
+
+    def _open(self, filename: str) -> None:
+        self._fd = open(filename, 'ab')
+
+    def _write_rows(self, rows: List[Sequence]) -> None:
+        chunks = []
+        for row in rows:
+            station = str(row[1]).encode('utf-8')
+            chunks.append(_BINARY_HEADER.pack(len(station), row[0]))
+            chunks.append(station)
+            chunks.append(_BINARY_VALUES.pack(*row[2:]))
+        self._fd.write(b''.join(chunks))
+        self._fd.flush()
+
+
+def read_binary_log(filename: str) -> Iterator[Tuple]:
+    """Read rows, in COLUMNS order, from a binary append log."""
+    with open(filename, 'rb') as fd:
+        buffer = fd.read()
+
+    offset = 0
+    while offset < len(buffer):
+        length, timestamp = _BINARY_HEADER.unpack_from(buffer, offset)
+        offset += _BINARY_HEADER.size
+        station = buffer[offset:offset + length].decode('utf-8')
+        offset += length
+        values = _BINARY_VALUES.unpack_from(buffer, offset)
+        offset += _BINARY_VALUES.size
+        yield (timestamp, station) + values
+
+
+class ParquetWriter(_RotatingWriter):
+    """Buffered Parquet writer, every flush is written as a row group. Requires pyarrow."""
+
+    def __init__(self, path: str, **kwargs):
+        """Initializer."""
+        import pyarrow
+
+        super().__init__(path, **kwargs)
+        self._schema = pyarrow.schema([
+            ('timestamp', pyarrow.int64()),
+            ('station', pyarrow.string()),
+            ('actual_power', pyarrow.float64()),
+            ('today_income', pyarrow.float64()),
+            ('total_income', pyarrow.float64()),
+            ('etoday', pyarrow.float64()),
+            ('etotal', pyarrow.int64()),
+        ])
+        self._bytes = 0
+
+    def _open(self, filename: str) -> None:
+        import pyarrow.parquet
+
+        # parquet files can not be appended to, never overwrite an existing file
+        while os.path.exists(filename):
+            self._sequence += 1
+            filename = self.filename = self._filename()
+        self._fd = pyarrow.parquet.ParquetWriter(filename, self._schema)
+        self._bytes = 0
+
+    def _size(self) -> int:
+        return self._bytes
+
+    def _write_rows(self, rows: List[Sequence]) -> None:
+        import pyarrow
+
+        columns = list(zip(*rows))
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+            schema=self._schema)
+        self._fd.write_table(table)
+        self._bytes += table.nbytes
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""Helpers for tests, serving portal responses from a test app."""
+
+from aiohttp import web
+
+
+def portal_with_handler(handler, method='GET', path='/serverapi/'):
+    """Create an app factory for test_client, with handler for the path of the portal."""
+    def create_app(loop):
+        app = web.Application(loop=loop)
+        app.router.add_route(method, path, handler)
+        return app
+
+    return create_app
+
+
+def portal_with_response(response):
+    """Create an app factory for test_client, always responding with response."""
+    def respond(request):
+        return web.Response(body=response)
+
+    return portal_with_handler(respond)
+
+
+def portal_with_responses(responses):
+    """Create an app factory for test_client, responding with the (status, body) pairs in turn."""
+    def respond(request):
+        status, body = responses.pop(0)
+        return web.Response(status=status, body=body)
+
+    return portal_with_handler(respond)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Tests for backfilling historical graphs."""
+
+import asyncio
+import json
+from datetime import date
+from datetime import datetime
+
+from aiohttp import web
+
+from solarportal import GRAPH_TYPE_DAY
+from solarportal import GRAPH_TYPE_MONTH
+from solarportal import GRAPH_TYPE_YEAR
+from solarportal import Powerstation
+from solarportal import SolarPortal
+from solarportal.backfill import Backfill
+from solarportal.backfill import Checkpoint
+from solarportal.backfill import GraphStore
+from solarportal.backfill import plan
+from solarportal.token_manager import TokenManager
+
+from helpers import portal_with_handler
+
+
+LOGIN_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<login>
+    <status>true</status>
+    <userID>1</userID>
+    <userName>user_1</userName>
+    <token>token_1</token>
+</login>'''
+
+GRAPH_RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<graphs>
+   <status>true</status>
+   <daypower>1.0</daypower>
+   <graph>
+      <datetime>1000000000</datetime>
+      <power>0.0</power>
+   </graph>
+   <graph>
+      <datetime>1000000300</datetime>
+      <power>1.0</power>
+   </graph>
+</graphs>'''
+
+
+def create_portal_app(requests):
+    def respond(request):
+        if request.query['method'] == 'Login':
+            return web.Response(body=LOGIN_RESPONSE)
+
+        requests.append((request.query['stationid'], request.query['datetime'][:10]))
+        if request.query['stationid'] == '2' and request.query['datetime'].startswith('2018-01-02'):
+            return web.Response(status=500)
+        return web.Response(body=GRAPH_RESPONSE)
+
+    return portal_with_handler(respond)
+
+
+class MemoryStore(GraphStore):
+
+    def __init__(self):
+        self.points = []
+
+    def write_graph(self, station_id, graph_type, graph):
+        self.points += [(station_id, timestamp) for timestamp in graph.timestamps]
+
+
+EMPTY_GRAPH_RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<graphs>
+   <status>true</status>
+</graphs>'''
+
+
+class FailingStore(MemoryStore):
+
+    def write_graph(self, station_id, graph_type, graph):
+        if station_id == '2':
+            raise OSError('disk full')
+        super().write_graph(station_id, graph_type, graph)
+
+
+def test_plan():
+    assert plan(date(2018, 1, 30), date(2018, 2, 1)) == [
+        (GRAPH_TYPE_DAY, datetime(2018, 1, 30)),
+        (GRAPH_TYPE_DAY, datetime(2018, 1, 31)),
+        (GRAPH_TYPE_DAY, datetime(2018, 2, 1)),
+    ]
+    assert plan(date(2017, 11, 15), date(2018, 1, 1), 'day') == [
+        (GRAPH_TYPE_MONTH, datetime(2017, 11, 15)),
+        (GRAPH_TYPE_MONTH, datetime(2017, 12, 1)),
+        (GRAPH_TYPE_MONTH, datetime(2018, 1, 1)),
+    ]
+    assert plan(date(2017, 6, 1), date(2018, 6, 1), 'month') == [
+        (GRAPH_TYPE_YEAR, datetime(2017, 6, 1)),
+        (GRAPH_TYPE_YEAR, datetime(2018, 1, 1)),
+    ]
+
+
+def test_checkpoint(tmpdir):
+    path = str(tmpdir.join('checkpoint.log'))
+    checkpoint = Checkpoint(path)
+    checkpoint.mark_done('1', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+    checkpoint.save()
+    checkpoint.mark_done('1', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+    checkpoint.mark_done('2', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+    checkpoint.save()
+    with open(path) as fd:
+        assert fd.read() == '1|1|2018-01-01\n2|1|2018-01-01\n'
+
+    # a line cut off by a crash is ignored
+    with open(path, 'a') as fd:
+        fd.write('3|1|2018')
+    checkpoint = Checkpoint(path)
+    assert checkpoint.is_done('2', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+    assert not checkpoint.is_done('3', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+
+
+def test_checkpoint_json(tmpdir):
+    path = str(tmpdir.join('checkpoint.json'))
+    with open(path, 'w') as fd:
+        json.dump(['1|1|2018-01-01'], fd)
+
+    checkpoint = Checkpoint(path)
+    assert checkpoint.is_done('1', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+    checkpoint.mark_done('2', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+    checkpoint.save()
+    assert Checkpoint(path).is_done('1', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+    assert Checkpoint(path).is_done('2', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
+
+
+class TestBackfill:
+
+    async def test_resume(self, test_client, tmpdir):
+        requests = []
+        client = await test_client(create_portal_app(requests))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        powerstations = [Powerstation({'stationID': '1'}), Powerstation({'stationID': '2'})]
+        path = str(tmpdir.join('checkpoint.json'))
+
+        store = MemoryStore()
+        backfill = Backfill(portal, TokenManager(), 'user_1', 'password_1', store, Checkpoint(path))
+        await backfill.async_run(powerstations, date(2018, 1, 1), date(2018, 1, 3))
+        assert len(requests) == 6
+        assert (backfill.fetched, backfill.skipped, backfill.failed) == (5, 0, 1)
+        assert len(store.points) == 10
+
+        # only the failed graph is fetched again
+        requests.clear()
+        backfill = Backfill(portal, TokenManager(), 'user_1', 'password_1', MemoryStore(), Checkpoint(path))
+        await backfill.async_run(powerstations, date(2018, 1, 1), date(2018, 1, 3))
+        assert requests == [('2', '2018-01-02')]
+        assert (backfill.fetched, backfill.skipped, backfill.failed) == (0, 5, 1)
+
+    async def test_concurrency(self, test_client, tmpdir):
+        active = []
+        peak = []
+
+        async def respond(request):
+            if request.query['method'] == 'Login':
+                return web.Response(body=LOGIN_RESPONSE)
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.001)
+            active.pop()
+            return web.Response(body=GRAPH_RESPONSE)
+
+        client = await test_client(portal_with_handler(respond))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        powerstations = [Powerstation({'stationID': str(i)}) for i in range(5)]
+        backfill = Backfill(portal, TokenManager(), 'user_1', 'password_1', MemoryStore(), concurrency=2)
+        await backfill.async_run(powerstations, date(2018, 1, 1), date(2018, 1, 10))
+        assert backfill.fetched == 50
+        assert max(peak) == 2
+
+    async def test_empty_graph(self, test_client, tmpdir):
+        def respond(request):
+            if request.query['method'] == 'Login':
+                return web.Response(body=LOGIN_RESPONSE)
+            return web.Response(body=EMPTY_GRAPH_RESPONSE)
+
+        client = await test_client(portal_with_handler(respond))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        store = MemoryStore()
+        backfill = Backfill(portal, TokenManager(), 'user_1', 'password_1', store,
+                            Checkpoint(str(tmpdir.join('checkpoint.json'))))
+        await backfill.async_run([Powerstation({'stationID': '1'})], date(2018, 1, 1), date(2018, 1, 2))
+        assert (backfill.fetched, backfill.failed) == (2, 0)
+        assert store.points == []
+
+    async def test_store_error(self, test_client, tmpdir):
+        client = await test_client(create_portal_app([]))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        powerstations = [Powerstation({'stationID': '1'}), Powerstation({'stationID': '2'})]
+        path = str(tmpdir.join('checkpoint.json'))
+
+        store = FailingStore()
+        backfill = Backfill(portal, TokenManager(), 'user_1', 'password_1', store, Checkpoint(path))
+        await backfill.async_run(powerstations, date(2018, 1, 1), date(2018, 1, 1))
+        assert (backfill.fetched, backfill.failed) == (1, 1)
+        assert not Checkpoint(path).is_done('2', GRAPH_TYPE_DAY, datetime(2018, 1, 1))
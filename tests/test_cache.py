@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""Tests for response cache."""
+
+from solarportal.cache import ResponseCache
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache:
+
+    def test_ttl(self):
+        clock = Clock()
+        cache = ResponseCache(ttls={'Data': 60}, clock=clock)
+        assert cache.is_cached('Data')
+        assert not cache.is_cached('Login')
+
+        cache.set('a', {'value': 1}, cache.expires_at('Data'))
+        assert cache.get('a') == {'value': 1}
+
+        clock.now += 61
+        assert cache.get('a') is None
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_last_updated(self):
+        clock = Clock()
+        cache = ResponseCache(ttls={'Data': 60}, upload_interval=300, clock=clock)
+        assert cache.expires_at('Data', last_updated=900.0) == 1200.0
+        assert cache.expires_at('Data', last_updated=500.0) == 1060.0
+        assert cache.expires_at('Data', immutable=True) is None
+
+    def test_lru(self):
+        cache = ResponseCache(max_size=2)
+        cache.set('a', 1, None)
+        cache.set('b', 2, None)
+        assert cache.get('a') == 1
+        cache.set('c', 3, None)
+        assert len(cache) == 2
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""Tests for change detection."""
+
+from datetime import datetime
+from datetime import timedelta
+
+from solarportal import Data
+from solarportal import Powerstation
+from solarportal import SolarPortalError
+from solarportal.changes import ChangeTracker
+
+
+START = datetime(2018, 1, 1, 12, 0)
+
+
+def data(updated):
+    return Data({'detail': {'lastupdated': str(int(updated.timestamp()))}})
+
+
+class TestChangeTracker:
+
+    def test_filter(self):
+        tracker = ChangeTracker()
+        powerstation_1 = Powerstation({'stationID': '1'})
+        powerstation_2 = Powerstation({'stationID': '2', 'LastTime': str(int(START.timestamp()))})
+        error = SolarPortalError('Error')
+
+        results = [(powerstation_1, data(START)), (powerstation_2, powerstation_2), (powerstation_1, error)]
+        assert list(tracker.filter(results)) == results
+        assert list(tracker.filter(results)) == [(powerstation_1, error)]
+
+        newer = (powerstation_1, data(START + timedelta(minutes=5)))
+        assert list(tracker.filter(results + [newer])) == [(powerstation_1, error), newer]
+        assert tracker.last_seen('1') == START + timedelta(minutes=5)
+
+    def test_predict(self):
+        tracker = ChangeTracker(margin=timedelta(seconds=30))
+        assert tracker.predict_next('1') is None
+        assert tracker.next_poll('1', START) == START
+
+        for minutes in (0, 5, 10, 16, 20):
+            tracker.update('1', START + timedelta(minutes=minutes, seconds=7))
+        assert tracker.interval('1') == timedelta(minutes=5)
+
+        now = START + timedelta(minutes=21)
+        assert tracker.predict_next('1', now) == START + timedelta(minutes=25, seconds=7)
+        assert tracker.next_poll('1', now) == START + timedelta(minutes=25, seconds=37)
+
+        # missed updates keep the phase
+        now = START + timedelta(minutes=42)
+        assert tracker.predict_next('1', now) == START + timedelta(minutes=45, seconds=7)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""Tests for conditional and compressed requests."""
+
+from aiohttp import web
+
+from solarportal import Powerstation
+from solarportal import SolarPortal
+from solarportal import Token
+from solarportal.metrics import MetricsRegistry
+
+from helpers import portal_with_handler
+
+
+DATA_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<data>
+    <status>true</status>
+    <name>station_1</name>
+    <income><ActualPower>{power}</ActualPower></income>
+</data>'''
+
+
+class TestConditional:
+
+    async def test_etag(self, test_client):
+        requests = []
+
+        def respond(request):
+            requests.append(request.headers.get('If-None-Match'))
+            if request.headers.get('If-None-Match') == '"1"':
+                return web.Response(status=304)
+            return web.Response(body=DATA_RESPONSE.format(power='1.0'), headers={'ETag': '"1"'})
+
+        client = await test_client(portal_with_handler(respond))
+        metrics = MetricsRegistry()
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, skip_unchanged=True,
+                             metrics=metrics)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstation = Powerstation({'stationID': '1'})
+
+        first = await portal.async_get_data(token, powerstation)
+        second = await portal.async_get_data(token, powerstation)
+        assert requests == [None, '"1"']
+        assert second.actual_power == first.actual_power == 1.0
+        labels = (('method', 'Data'), ('portal', 'manual'))
+        assert metrics.counters['not_modified_total'][labels] == 1
+
+    async def test_same_body(self, test_client):
+        powers = ['1.0', '1.0', '2.0']
+
+        def respond(request):
+            return web.Response(body=DATA_RESPONSE.format(power=powers.pop(0)))
+
+        client = await test_client(portal_with_handler(respond))
+        metrics = MetricsRegistry()
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, skip_unchanged=True,
+                             metrics=metrics)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstation = Powerstation({'stationID': '1'})
+
+        assert (await portal.async_get_data(token, powerstation)).actual_power == 1.0
+        assert (await portal.async_get_data(token, powerstation)).actual_power == 1.0
+        assert (await portal.async_get_data(token, powerstation)).actual_power == 2.0
+        labels = (('method', 'Data'), ('portal', 'manual'))
+        assert metrics.counters['unchanged_total'][labels] == 1
+
+    async def test_compressed(self, test_client):
+        encodings = []
+
+        def respond(request):
+            encodings.append(request.headers.get('Accept-Encoding'))
+            response = web.Response(body=DATA_RESPONSE.format(power='1.0'))
+            response.enable_compression()
+            return response
+
+        client = await test_client(portal_with_handler(respond))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        data = await portal.async_get_data(token, Powerstation({'stationID': '1'}))
+        assert data.actual_power == 1.0
+        assert 'gzip' in encodings[0]
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Tests for polling daemon."""
+
+import asyncio
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+from aiohttp import web
+
+from solarportal import Powerstation
+from solarportal import SolarPortal
+from solarportal.daemon import Account
+from solarportal.daemon import Daemon
+from solarportal.daemon import ceil_datetime
+from solarportal.daemon import station_offset
+from solarportal.ratelimit import RetryPolicy
+from solarportal.sinks import CsvSink
+from solarportal.sinks import Sink
+
+from helpers import portal_with_handler
+
+
+LOGIN_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<login>
+    <status>true</status>
+    <userID>1</userID>
+    <userName>user_1</userName>
+    <token>token_1</token>
+</login>'''
+
+POWERSTATIONS_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<list>
+    <status>true</status>
+    <power><stationID>1</stationID></power>
+    <power><stationID>2</stationID></power>
+</list>'''
+
+ERROR_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<error>
+    <status>false</status>
+    <errorCode>1</errorCode>
+    <errorMessage>Invalid password</errorMessage>
+</error>'''
+
+DATA_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<data>
+    <status>true</status>
+    <income>
+        <TodayIncome>1.00</TodayIncome>
+        <ActualPower>100.1</ActualPower>
+        <etoday>1.0</etoday>
+        <etotal>300</etotal>
+        <TotalIncome>10.0</TotalIncome>
+    </income>
+    <detail>
+        <lastupdated>1000000000</lastupdated>
+    </detail>
+</data>'''
+
+RESPONSES = {
+    'Login': LOGIN_RESPONSE,
+    'Powerstationslist': POWERSTATIONS_RESPONSE,
+    'Data': DATA_RESPONSE,
+}
+
+
+def respond(request):
+    return web.Response(body=RESPONSES[request.query['method']])
+
+
+class RecordingSink(Sink):
+
+    def __init__(self):
+        self.written = []
+
+    async def async_write(self, powerstation, timestamp, data):
+        self.written.append((powerstation.station_id, timestamp, data.actual_power))
+
+
+class FailingSink(Sink):
+
+    async def async_write(self, powerstation, timestamp, data):
+        raise OSError('disk full')
+
+
+def test_ceil_datetime():
+    interval = timedelta(minutes=5)
+    assert ceil_datetime(datetime(2018, 1, 1, 12, 1, 30), interval) == datetime(2018, 1, 1, 12, 5)
+    assert ceil_datetime(datetime(2018, 1, 1, 12, 5), interval) == datetime(2018, 1, 1, 12, 5)
+
+
+def test_station_offset():
+    spread = timedelta(minutes=1)
+    offsets = [station_offset('omnik/user_1/{}'.format(i), spread) for i in range(20)]
+    assert all(timedelta() <= offset < spread for offset in offsets)
+    assert len(set(offsets)) > 1
+    assert station_offset('omnik/user_1/1', spread) == offsets[1]
+
+
+class TestDaemon:
+
+    async def test_poll(self, test_client):
+        client = await test_client(portal_with_handler(respond))
+
+        account = Account('manual', 'user_1', 'password_1', base_url='/serverapi/?', stations=['2'])
+        sink = RecordingSink()
+        daemon = Daemon([account], [FailingSink(), sink],
+                        portal_factory=lambda account: SolarPortal(account.portal, account.base_url, client=client))
+
+        powerstations = await daemon.async_get_powerstations(account)
+        assert [p.station_id for p in powerstations] == ['2']
+
+        timestamp = datetime(2018, 1, 1, 12, 5)
+        await daemon.async_poll(account, powerstations[0], timestamp)
+        assert sink.written == [('2', timestamp, 100.1)]
+
+        # not updated by the portal, not written again
+        await daemon.async_poll(account, powerstations[0], timestamp + timedelta(minutes=5))
+        assert len(sink.written) == 1
+
+    async def test_poll_without_last_updated(self, test_client):
+        client = await test_client(portal_with_handler(respond))
+
+        account = Account('manual', 'user_1', 'password_1', base_url='/serverapi/?')
+        sink = RecordingSink()
+        daemon = Daemon([account], [sink],
+                        portal_factory=lambda account: SolarPortal(account.portal, account.base_url, client=client))
+
+        RESPONSES['Data'] = DATA_RESPONSE.replace('<lastupdated>1000000000</lastupdated>', '')
+        try:
+            timestamp = datetime(2018, 1, 1, 12, 5)
+            await daemon.async_poll(account, Powerstation({'stationID': '1'}), timestamp)
+        finally:
+            RESPONSES['Data'] = DATA_RESPONSE
+        assert sink.written == [('1', timestamp, 100.1)]
+
+    async def test_run_unexpected_error(self, test_client):
+        client = await test_client(portal_with_handler(respond))
+
+        account = Account('manual', 'user_1', 'password_1', base_url='/serverapi/?',
+                          interval=timedelta(seconds=1))
+        polled = []
+
+        class BrokenDaemon(Daemon):
+
+            async def async_poll(self, account, powerstation, timestamp):
+                polled.append(powerstation.station_id)
+                if powerstation.station_id == '1':
+                    raise RuntimeError('broken')
+
+        daemon = BrokenDaemon([account], [], spread=timedelta(),
+                              portal_factory=lambda account: SolarPortal(account.portal, account.base_url,
+                                                                         client=client))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(daemon.async_run(), 1.5)
+        assert set(polled) == {'1', '2'}
+
+    async def test_run_failing_account(self, test_client):
+        logins = []
+
+        def respond_login(request):
+            if request.query['method'] == 'Login':
+                logins.append(request.query['username'])
+                if request.query['username'] == 'user_2':
+                    return web.Response(body=ERROR_RESPONSE)
+            return respond(request)
+
+        client = await test_client(portal_with_handler(respond_login))
+
+        accounts = [
+            Account('manual', 'user_1', 'password_1', base_url='/serverapi/?', interval=timedelta(seconds=1)),
+            Account('manual', 'user_2', 'wrong', base_url='/serverapi/?', interval=timedelta(seconds=1)),
+        ]
+        sink = RecordingSink()
+        daemon = Daemon(accounts, [sink], spread=timedelta(), changes_only=False,
+                        retry_policy=RetryPolicy(base_delay=0.01, jitter=False),
+                        portal_factory=lambda account: SolarPortal(account.portal, account.base_url,
+                                                                   client=client))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(daemon.async_run(), 1.5)
+        assert {station_id for station_id, _, _ in sink.written} == {'1', '2'}
+        assert logins.count('user_2') > 1
+
+
+class TestCsvSink:
+
+    async def test_write(self, tmpdir, loop):
+        filename = str(tmpdir.join('output.csv'))
+        sink = CsvSink(filename)
+
+        class Result:
+            station_id = '1'
+            actual_power = 100.1
+            today_income = 1.0
+            total_income = 10.0
+            etoday = 1.0
+            etotal = 300
+
+        await sink.async_write(Result(), datetime.fromtimestamp(1000000000), Result())
+        await sink.aclose()
+        with open(filename) as fd:
+            assert fd.read().splitlines() == [
+                CsvSink.HEADER,
+                '1000000000;1;100.1;1.0;10.0;1.0;300',
+            ]
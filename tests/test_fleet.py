@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Tests for fleet aggregation."""
+
+import pytest
+
+import solarportal.fleet
+from solarportal import Data
+from solarportal import Powerstation
+from solarportal import SolarPortalError
+from solarportal.fleet import FleetAggregator
+
+
+def powerstation(station_id, city, country='NL', province='Utrecht'):
+    return Powerstation({'stationID': station_id, 'country': country, 'province': province, 'city': city})
+
+
+def data(power, capacity, etoday=1.0):
+    return Data({
+        'income': {'ActualPower': str(power), 'etoday': str(etoday), 'etotal': '100', 'TotalIncome': '10.0'},
+        'detail': {'Capacity': str(capacity)},
+    })
+
+
+def fleet():
+    aggregator = FleetAggregator()
+    aggregator.update_many([
+        (powerstation('1', 'Utrecht'), data(1000, 4.0)),
+        (powerstation('2', 'Utrecht'), data(3000, 4.0)),
+        (powerstation('3', 'Zeist'), data(400, 2.0)),
+        (powerstation('4', 'Zeist'), SolarPortalError('failed')),
+    ])
+    return aggregator
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(solarportal.fleet, 'numpy', None)
+    elif solarportal.fleet.numpy is None:
+        pytest.skip('numpy not installed')
+
+
+class TestFleetAggregator:
+
+    def test_totals(self):
+        aggregator = fleet()
+        assert len(aggregator) == 3
+        totals = aggregator.totals()[()]
+        assert totals['stations'] == 3
+        assert totals['actual_power'] == 4400.0
+        assert totals['capacity_factor'] == pytest.approx(0.44)
+
+        cities = aggregator.totals('city')
+        assert cities[('NL', 'Utrecht', 'Utrecht')]['actual_power'] == 4000.0
+        assert cities[('NL', 'Utrecht', 'Zeist')]['stations'] == 1
+        assert aggregator.totals('province')[('NL', 'Utrecht')]['etoday'] == 3.0
+
+        with pytest.raises(ValueError):
+            aggregator.totals('street')
+
+    def test_incremental(self):
+        aggregator = fleet()
+        aggregator.update(powerstation('3', 'Utrecht'), data(800, 2.0))
+        cities = aggregator.totals('city')
+        assert ('NL', 'Utrecht', 'Zeist') not in cities
+        assert cities[('NL', 'Utrecht', 'Utrecht')]['actual_power'] == 4800.0
+        assert aggregator.totals()[()]['actual_power'] == 4800.0
+
+        aggregator.remove('1')
+        assert '1' not in aggregator
+        assert aggregator.totals()[()]['stations'] == 2
+        assert aggregator.totals()[()]['actual_power'] == 3800.0
+        assert sorted(aggregator.capacity_factors()) == ['2', '3']
+
+    def test_percentiles(self, backend):
+        aggregator = fleet()
+        percentiles = aggregator.percentiles('actual_power', (0, 50, 75, 100))
+        assert percentiles == {0: 400.0, 50: 1000.0, 75: 2000.0, 100: 3000.0}
+        assert FleetAggregator().percentiles('actual_power') == {}
+
+    def test_underperformers(self, backend):
+        aggregator = fleet()
+        aggregator.update(powerstation('5', 'Zeist'), Data({'income': {'ActualPower': '10'}}))
+        assert aggregator.underperformers(2) == [('3', 0.2), ('1', 0.25)]
+        assert [station_id for station_id, _ in aggregator.underperformers(10)] == ['3', '1', '2']
+
+    def test_column_held(self, backend):
+        aggregator = fleet()
+        power = aggregator.column('actual_power')
+        aggregator.update(powerstation('5', 'Zeist'), data(200, 1.0))
+        aggregator.remove('1')
+        assert list(power) == [1000.0, 3000.0, 400.0]
+        assert sorted(aggregator.column('actual_power')) == [200.0, 400.0, 3000.0]
+        assert len(aggregator) == 3
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Tests for metrics."""
+
+import logging
+
+from solarportal import SolarPortal
+from solarportal import Token
+from solarportal.metrics import Histogram
+from solarportal.metrics import MetricsRegistry
+
+from helpers import portal_with_response
+
+
+COUNT_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<list>
+    <status>true</status>
+    <recordCount>1</recordCount>
+</list>'''
+
+
+def test_histogram():
+    histogram = Histogram(buckets=(1, 2))
+    for value in (0.5, 1.5, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.cumulative_counts() == [1, 3]
+    assert histogram.count == 4
+    assert histogram.sum == 6.5
+
+
+def test_to_prometheus():
+    metrics = MetricsRegistry(buckets=(1, ))
+    metrics.observe('request_seconds', 0.5, method='Data')
+    metrics.inc('retries_total', method='Data')
+    metrics.inc('retries_total', method='Data')
+    metrics.inc('errors_total', error='x"y\\z')
+
+    assert metrics.to_prometheus() == '\n'.join([
+        '# TYPE solarportal_request_seconds histogram',
+        'solarportal_request_seconds_bucket{method="Data",le="1"} 1',
+        'solarportal_request_seconds_bucket{method="Data",le="+Inf"} 1',
+        'solarportal_request_seconds_sum{method="Data"} 0.5',
+        'solarportal_request_seconds_count{method="Data"} 1',
+        '# TYPE solarportal_errors_total counter',
+        'solarportal_errors_total{error="x\\"y\\\\z"} 1',
+        '# TYPE solarportal_retries_total counter',
+        'solarportal_retries_total{method="Data"} 2',
+    ]) + '\n'
+
+
+def test_listener():
+    seen = []
+    metrics = MetricsRegistry()
+    metrics.add_listener(lambda name, labels, value: seen.append((name, labels, value)))
+    metrics.inc('errors_total', 2, error='TimeoutError')
+    assert seen == [('errors_total', {'error': 'TimeoutError'}, 2)]
+
+
+class TestMetrics:
+
+    async def test_request_metrics(self, test_client, caplog):
+        client = await test_client(portal_with_response(COUNT_RESPONSE))
+
+        metrics = MetricsRegistry()
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, metrics=metrics)
+        token = Token({'token': 'secret_token', 'userName': 'user_1'})
+        with caplog.at_level(logging.DEBUG, logger='solarportal'):
+            assert await portal.async_get_powerstation_count(token) == 1
+
+        labels = (('method', 'PowerstationslistCount'), ('phase', 'parse'), ('portal', 'manual'))
+        assert metrics.histograms['request_seconds'][labels].count == 1
+        labels = (('method', 'PowerstationslistCount'), ('portal', 'manual'))
+        assert metrics.counters['response_bytes_total'][labels] == len(COUNT_RESPONSE)
+        assert 'secret_token' not in caplog.text
+        assert 'token=***' in caplog.text
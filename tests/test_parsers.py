@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""Tests for parsers."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aiohttp import web
+
+from solarportal import Data
+from solarportal import Error
+from solarportal import Graph
+from solarportal import Powerstation
+from solarportal import SolarPortal
+from solarportal import Token
+from solarportal.parsers import BACKENDS
+from solarportal.parsers import RecordBuilder
+from solarportal.parsers import get_backend
+from solarportal.parsers import parse
+from solarportal.parsers import parse_response
+
+from helpers import portal_with_handler
+from helpers import portal_with_response
+
+
+POWERSTATIONS_RESPONSE = b'''<?xml version="1.0" encoding="utf-8" ?>
+<list>
+    <status>true</status>
+    <power>
+        <stationID>1</stationID>
+        <name>station_1</name>
+        <ActualPower>100.1</ActualPower>
+        <etotal>300</etotal>
+        <LastTime>1000000000</LastTime>
+        <unknown><nested>1</nested></unknown>
+        <WiFi><id>600000000</id><inverter>1</inverter></WiFi>
+    </power>
+    <power>
+        <stationID>2</stationID>
+        <name>station_2</name>
+    </power>
+</list>'''
+
+ERRORS_RESPONSE = b'''<?xml version="1.0" encoding="utf-8" ?>
+<list>
+    <status>true</status>
+    <errTotal>1</errTotal>
+    <error>
+        <DateTime>1000000000</DateTime>
+        <inverter>NLBN1</inverter>
+        <invErrCode>101</invErrCode>
+        <state>0</state>
+        <text>Isolation fault</text>
+    </error>
+</list>'''
+
+GRAPH_RESPONSE = b'''<?xml version="1.0" encoding="UTF-8"?>
+<graphs>
+   <status>true</status>
+   <daypower>1.0</daypower>
+   <graph><datetime>1000000000</datetime><power>0.0</power></graph>
+   <graph><datetime>1000000001</datetime><power>1.0</power></graph>
+</graphs>'''
+
+DATA_RESPONSE = b'''<?xml version="1.0" encoding="utf-8" ?>
+<data>
+    <status>true</status>
+    <name>station_1</name>
+    <income><ActualPower>100.0</ActualPower><etotal>300</etotal></income>
+    <detail><lastupdated>1000000000</lastupdated><WiFi><id>6</id></WiFi></detail>
+</data>'''
+
+
+def build(body, record_class, tag=None, backend=None):
+    builder = RecordBuilder(record_class, tag, backend=backend)
+    for i in range(0, len(body), 13):
+        builder.feed(body[i:i + 13])
+    return builder, builder.close()
+
+
+def same_fields(record, expected):
+    for name in record._FIELDS:
+        value, expected_value = getattr(record, name, 'missing'), getattr(expected, name, 'missing')
+        if hasattr(value, '_FIELDS'):
+            same_fields(value, expected_value)
+        else:
+            assert value == expected_value, name
+
+
+def test_get_backend():
+    assert get_backend('stdlib') == 'stdlib'
+    assert get_backend() in BACKENDS
+    with pytest.raises(ValueError):
+        get_backend('unknown')
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+def test_backends_same_result(backend):
+    for body in (POWERSTATIONS_RESPONSE, ERRORS_RESPONSE, GRAPH_RESPONSE):
+        assert parse(body, backend=backend) == parse(body, backend='stdlib')
+
+
+@pytest.mark.parametrize('backend', sorted(BACKENDS))
+class TestRecordBuilder:
+
+    def test_list(self, backend):
+        builder, result = build(POWERSTATIONS_RESPONSE, Powerstation, 'power', backend)
+        expected = parse(POWERSTATIONS_RESPONSE)['power']
+        assert builder.status == 'true'
+        assert len(result['power']) == 2
+        for record, data in zip(result['power'], expected):
+            assert isinstance(record, Powerstation)
+            same_fields(record, Powerstation(data))
+        assert result['power'][0].wifi.id == '600000000'
+        assert result['power'][1].wifi is None
+
+    def test_list_other_values(self, backend):
+        _, result = build(ERRORS_RESPONSE, Error, 'error', backend)
+        assert result['errTotal'] == '1'
+        same_fields(result['error'][0], Error(parse(ERRORS_RESPONSE)['error']))
+
+    def test_root(self, backend):
+        _, graph = build(GRAPH_RESPONSE, Graph, backend=backend)
+        expected = Graph(parse(GRAPH_RESPONSE))
+        assert graph.day_power == 1.0
+        assert list(graph.timestamps) == list(expected.timestamps)
+        assert list(graph.powers) == list(expected.powers)
+
+    def test_nested_paths(self, backend):
+        _, data = build(DATA_RESPONSE, Data, backend=backend)
+        same_fields(data, Data(parse(DATA_RESPONSE)))
+        assert data.wifi.id == '6'
+
+
+def test_parse_response():
+    result, status, error_code, _ = parse_response(POWERSTATIONS_RESPONSE)
+    assert result == parse(POWERSTATIONS_RESPONSE)
+    assert status == 'true'
+    assert error_code is None
+
+    result, _, _, _ = parse_response(ERRORS_RESPONSE, records=(Error, 'error'))
+    assert isinstance(result['error'][0], Error)
+
+
+class CountingExecutor(ThreadPoolExecutor):
+
+    def __init__(self):
+        super().__init__(max_workers=1)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+class TestExecutor:
+
+    async def test_large_responses(self, test_client):
+        client = await test_client(portal_with_response(POWERSTATIONS_RESPONSE))
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        with CountingExecutor() as executor:
+            portal = SolarPortal('manual', base_url='/serverapi/?', client=client, coalesce=False,
+                                 executor=executor, executor_threshold=len(POWERSTATIONS_RESPONSE))
+            powerstations = await portal.async_get_powerstations(token)
+            assert [powerstation.station_id for powerstation in powerstations] == ['1', '2']
+            assert executor.submitted == 1
+
+            portal = SolarPortal('manual', base_url='/serverapi/?', client=client,
+                                 executor=executor, executor_threshold=len(POWERSTATIONS_RESPONSE) + 1)
+            await portal.async_get_powerstations(token)
+            assert executor.submitted == 1
+
+    async def test_compressed_chunked_response(self, test_client):
+        async def respond(request):
+            response = web.StreamResponse()
+            response.enable_compression()
+            response.enable_chunked_encoding()
+            await response.prepare(request)
+            await response.write(POWERSTATIONS_RESPONSE)
+            await response.write_eof()
+            return response
+
+        client = await test_client(portal_with_handler(respond))
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        with CountingExecutor() as executor:
+            portal = SolarPortal('manual', base_url='/serverapi/?', client=client,
+                                 executor=executor, executor_threshold=len(POWERSTATIONS_RESPONSE))
+            powerstations = await portal.async_get_powerstations(token)
+            assert [powerstation.station_id for powerstation in powerstations] == ['1', '2']
+            assert executor.submitted == 1
+
+
+class TestDirectRecords:
+
+    async def test_powerstations(self, test_client):
+        client = await test_client(portal_with_response(POWERSTATIONS_RESPONSE))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, parser='stdlib',
+                             direct_records=True)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstations = await portal.async_get_powerstations(token)
+        assert [powerstation.station_id for powerstation in powerstations] == ['1', '2']
+        assert powerstations[0].actual_power == 100.1
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Tests for batched uploads to PVOutput."""
+
+from datetime import datetime
+from datetime import timedelta
+
+from aiohttp import web
+
+from solarportal.pvoutput import PVOutputUploader
+
+from helpers import portal_with_handler
+
+
+URL = '/service/r2/addbatchstatus.jsp'
+
+
+def create_pvoutput_app(received, statuses):
+    async def respond(request):
+        post = await request.post()
+        if statuses:
+            status = statuses.pop(0)
+            if status != 200:
+                return web.Response(status=status, text='Error')
+
+        received.append((request.headers['X-Pvoutput-SystemId'], post['data']))
+        return web.Response(text='OK')
+
+    return portal_with_handler(respond, 'POST', URL)
+
+
+def add_statuses(uploader, count):
+    start = datetime(2018, 1, 1, 8, 0)
+    for i in range(count):
+        uploader.add_status(start + timedelta(minutes=5 * i), i * 10.0, 100.0)
+
+
+class TestPVOutputUploader:
+
+    async def test_batches(self, test_client):
+        received = []
+        client = await test_client(create_pvoutput_app(received, []))
+
+        uploader = PVOutputUploader('api_key', '1', session=client, url=URL)
+        add_statuses(uploader, 65)
+        assert await uploader.async_upload() == 65
+        assert [len(data.split(';')) for _, data in received] == [30, 30, 5]
+        assert received[0][0] == '1'
+        assert received[0][1].split(';')[:2] == ['20180101,08:00,0.0,100.0', '20180101,08:05,10.0,100.0']
+        assert not uploader.queue
+
+    async def test_quota(self, test_client):
+        received = []
+        client = await test_client(create_pvoutput_app(received, []))
+
+        uploader = PVOutputUploader('api_key', '1', session=client, url=URL, requests_per_hour=2)
+        add_statuses(uploader, 65)
+        assert await uploader.async_upload() == 60
+        assert len(uploader.queue) == 5
+
+    async def test_backfill(self, test_client, tmpdir):
+        received = []
+        client = await test_client(create_pvoutput_app(received, [503]))
+        path = str(tmpdir.join('queue.json'))
+
+        uploader = PVOutputUploader('api_key', '1', path=path, session=client, url=URL)
+        add_statuses(uploader, 2)
+        assert await uploader.async_upload() == 0
+        assert len(uploader.queue) == 2
+
+        # restart, with the queue restored from disk
+        uploader = PVOutputUploader('api_key', '1', path=path, session=client, url=URL)
+        assert len(uploader.queue) == 2
+        assert await uploader.async_upload() == 2
+        assert len(received) == 1
+
+        uploader = PVOutputUploader('api_key', '1', path=path, session=client, url=URL)
+        assert not uploader.queue
+
+    async def test_unauthorized(self, test_client):
+        received = []
+        client = await test_client(create_pvoutput_app(received, [401]))
+
+        uploader = PVOutputUploader('api_key', '1', session=client, url=URL)
+        add_statuses(uploader, 2)
+        assert await uploader.async_upload() == 0
+        assert len(uploader.queue) == 2
+
+        # backing off
+        assert await uploader.async_upload() == 0
+        assert not received
+
+    async def test_rejected(self, test_client):
+        received = []
+        client = await test_client(create_pvoutput_app(received, [400]))
+
+        uploader = PVOutputUploader('api_key', '1', session=client, url=URL)
+        add_statuses(uploader, 2)
+        await uploader.async_upload()
+        assert not uploader.queue
+        assert not received
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Tests for rate limiting and retrying."""
+
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from solarportal import SolarPortal
+from solarportal import SolarPortalApiError
+from solarportal import SolarPortalHttpError
+from solarportal import SolarPortalParseError
+from solarportal import Token
+from solarportal.ratelimit import AdaptiveConcurrency
+from solarportal.ratelimit import RetryPolicy
+from solarportal.ratelimit import TokenBucket
+from solarportal.ratelimit import is_retryable
+
+from helpers import portal_with_handler
+from helpers import portal_with_responses
+
+
+COUNT_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<list>
+    <status>true</status>
+    <recordCount>1</recordCount>
+</list>'''
+
+ERROR_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<error>
+    <status>false</status>
+    <errorCode>1</errorCode>
+    <errorMessage>No authorization</errorMessage>
+</error>'''
+
+
+def test_is_retryable():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(SolarPortalHttpError(503))
+    assert is_retryable(SolarPortalHttpError(429))
+    assert not is_retryable(SolarPortalHttpError(404))
+    assert not is_retryable(SolarPortalApiError('1', 'No authorization'))
+
+
+def test_retry_policy():
+    policy = RetryPolicy(attempts=3, base_delay=1, max_delay=3, jitter=False)
+    assert [policy.delay(attempt) for attempt in range(4)] == [1, 2, 3, 3]
+    assert policy.should_retry(asyncio.TimeoutError(), 1)
+    assert not policy.should_retry(asyncio.TimeoutError(), 2)
+
+    policy = RetryPolicy(base_delay=1)
+    assert 0 <= policy.delay(2) <= 4
+
+
+class TestRateLimit:
+
+    async def test_token_bucket(self):
+        bucket = TokenBucket(rate=50, burst=2)
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        assert time.monotonic() - start >= 0.035
+
+    async def test_adaptive_concurrency(self):
+        limiter = AdaptiveConcurrency(initial=2, minimum=1, maximum=3)
+        for _ in range(3):
+            await limiter.acquire()
+            await limiter.release()
+        assert limiter.limit == 3
+
+        await limiter.acquire()
+        await limiter.release(SolarPortalHttpError(503))
+        assert limiter.limit == 1
+
+        await limiter.acquire()
+        await limiter.release(SolarPortalApiError('1', 'No authorization'))
+        assert limiter.limit == 1
+
+    async def test_retry(self, test_client):
+        responses = [(503, ''), (500, ''), (200, COUNT_RESPONSE)]
+        client = await test_client(portal_with_responses(responses))
+
+        retry_policy = RetryPolicy(attempts=3, base_delay=0.001)
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, retry_policy=retry_policy)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        assert await portal.async_get_powerstation_count(token) == 1
+        assert not responses
+
+    async def test_no_retry_fatal(self, test_client):
+        responses = [(200, ERROR_RESPONSE), (200, COUNT_RESPONSE)]
+        client = await test_client(portal_with_responses(responses))
+
+        retry_policy = RetryPolicy(attempts=3, base_delay=0.001)
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, retry_policy=retry_policy)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        with pytest.raises(SolarPortalApiError):
+            await portal.async_get_powerstation_count(token)
+        assert len(responses) == 1
+
+    async def test_concurrency_released_on_invalid_response(self, test_client):
+        responses = [(200, '<html>maintenance'), (200, '<html>maintenance'), (200, COUNT_RESPONSE)]
+        client = await test_client(portal_with_responses(responses))
+
+        limiter = AdaptiveConcurrency(initial=2)
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, concurrency_limiter=limiter)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        for _ in range(2):
+            with pytest.raises(SolarPortalParseError):
+                await portal.async_get_powerstation_count(token)
+        assert await asyncio.wait_for(portal.async_get_powerstation_count(token), 1) == 1
+        assert limiter.limit == 2
+
+    async def test_concurrency_released_on_cancel(self, test_client):
+        async def respond(request):
+            if request.query.get('page') == 'slow':
+                await asyncio.sleep(10)
+            return web.Response(body=COUNT_RESPONSE)
+
+        client = await test_client(portal_with_handler(respond))
+
+        limiter = AdaptiveConcurrency(initial=1)
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, concurrency_limiter=limiter)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(portal._fetch({'method': 'PowerstationslistCount', 'page': 'slow'}), 0.1)
+        assert await asyncio.wait_for(portal.async_get_powerstation_count(token), 1) == 1
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Tests for sharded sweeps."""
+
+import pickle
+
+from aiohttp import web
+
+from solarportal import Data
+from solarportal import Powerstation
+from solarportal import SolarPortalApiError
+from solarportal import SolarPortalHttpError
+from solarportal import Token
+from solarportal.sharding import ShardedSweep
+from solarportal.sharding import shard
+
+
+DATA_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<data>
+    <status>true</status>
+    <name>station_{station_id}</name>
+    <income><ActualPower>{station_id}.0</ActualPower></income>
+</data>'''
+
+ERROR_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<error>
+    <status>false</status>
+    <errorCode>1</errorCode>
+    <errorMessage>Unknown station</errorMessage>
+</error>'''
+
+
+def respond_data(request):
+    station_id = request.query['stationid']
+    if station_id == '3':
+        return web.Response(body=ERROR_RESPONSE)
+    return web.Response(body=DATA_RESPONSE.format(station_id=station_id))
+
+
+def test_shard():
+    assert shard([1, 2, 3, 4, 5], 2) == [[1, 3, 5], [2, 4]]
+    assert shard([1], 3) == [[1]]
+
+
+def test_pickle_errors():
+    error = pickle.loads(pickle.dumps(SolarPortalHttpError(503)))
+    assert error.status == 503
+    error = pickle.loads(pickle.dumps(SolarPortalApiError('1', 'No authorization')))
+    assert error.error_message == 'No authorization'
+
+
+class TestShardedSweep:
+
+    async def test_aiter_data(self, test_server):
+        app = web.Application()
+        app.router.add_route('GET', '/serverapi/', respond_data)
+        server = await test_server(app)
+
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        sweep = ShardedSweep('manual', token, processes=2, rate=1000, batch_size=2,
+                             portal_options={'base_url': str(server.make_url('/serverapi/')) + '?'})
+        powerstations = [Powerstation({'stationID': str(station_id)}) for station_id in range(1, 6)]
+
+        results = {}
+        async for powerstation, result in sweep.aiter_data(powerstations):
+            results[powerstation.station_id] = result
+
+        assert sorted(results) == ['1', '2', '3', '4', '5']
+        assert isinstance(results['1'], Data)
+        assert results['5'].actual_power == 5.0
+        assert isinstance(results['3'], SolarPortalApiError)
@@ -1,26 +1,209 @@
 # -*- coding: utf-8 -*-
 """Tests for Solarportal API for python."""
 
+import asyncio
 from datetime import datetime
+from datetime import timedelta
+from xml.etree import ElementTree as ET
 
 import pytest
 from aiohttp import web
 
+from solarportal import Data
+from solarportal import Graph
+from solarportal import Powerstation
 from solarportal import SolarPortal
 from solarportal import SolarPortalError
+from solarportal import SolarPortalParseError
 from solarportal import Token
+from solarportal import _XmlDictBuilder
+from solarportal import _xml_to_dict
+from solarportal.cache import ResponseCache
 
+from helpers import portal_with_handler
+from helpers import portal_with_response
 
-def portal_with_response(response):
-    def respond(request):
-        return web.Response(body=response)
 
-    def create_app(loop):
-        app = web.Application(loop=loop)
-        app.router.add_route('GET', '/serverapi/', respond)
-        return app
+DATA_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<data>
+    <status>true</status>
+    <errorCode> </errorCode>
+    <errorMessage> </errorMessage>
+    <name>station_{station_id}</name>
+    <income>
+        <TodayIncome>1.00</TodayIncome>
+        <ActualPower>{station_id}00.0</ActualPower>
+        <etoday>1.0</etoday>
+        <etotal>300</etotal>
+        <TotalIncome>10.0</TotalIncome>
+    </income>
+    <detail>
+        <Capacity>3.7</Capacity>
+        <commissioning>1000000000</commissioning>
+        <lastupdated>1000000000</lastupdated>
+    </detail>
+</data>'''
+
+
+ERROR_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<error>
+    <status>false</status>
+    <errorCode>1</errorCode>
+    <errorMessage>Unknown station</errorMessage>
+</error>'''
+
+
+def respond_data(request):
+    station_id = request.query['stationid']
+    if station_id == '2':
+        return web.Response(body=ERROR_RESPONSE)
+    return web.Response(body=DATA_RESPONSE.format(station_id=station_id))
+
+
+GRAPH_RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<graphs>
+   <status>true</status>
+   <errorCode />
+   <errorMessage />
+   <daypower>1.0</daypower>
+   <graph>
+      <datetime>1000000000</datetime>
+      <power>0.0</power>
+   </graph>
+   <graph>
+      <datetime>1000000001</datetime>
+      <power>1.0</power>
+   </graph>
+   <graph>
+      <datetime>1000000002</datetime>
+      <power>2.0</power>
+   </graph>
+</graphs>'''
+
+
+class TestXmlDictBuilder:
+
+    def test_same_as_xml_to_dict(self):
+        body = GRAPH_RESPONSE.encode('utf-8')
+        builder = _XmlDictBuilder()
+        for i in range(0, len(body), 7):
+            builder.feed(body[i:i + 7])
+        result = builder.close()
+
+        assert result == _xml_to_dict(ET.fromstring(body))
+        assert len(result['graph']) == 3
+        assert result['graph'][2] == {'datetime': '1000000002', 'power': '2.0'}
+        assert builder.status == 'true'
+
+    def test_status_first_in_document_order(self):
+        builder = _XmlDictBuilder()
+        builder.feed(ERROR_RESPONSE.encode('utf-8'))
+        builder.close()
+
+        assert builder.status == 'false'
+        assert builder.error_code == '1'
+        assert builder.error_message == 'Unknown station'
+
+
+class TestRecords:
+
+    DATA = {
+        'name': 'station_name',
+        'income': {'ActualPower': '100.1', 'etoday': '1.0', 'etotal': '300'},
+        'detail': {'lastupdated': '1000000000'},
+    }
+
+    def test_eager(self):
+        data = Data(self.DATA)
+        assert data.name == 'station_name'
+        assert data.actual_power == 100.1
+        assert data.energy_total == 300
+        assert data.last_updated == datetime.fromtimestamp(1000000000)
+        assert data.wifi is None
+        assert not hasattr(data, '__dict__')
+        with pytest.raises(AttributeError):
+            data.capacity
+
+    def test_lazy(self):
+        raw = dict(self.DATA, income=dict(self.DATA['income']))
+        data = Data(raw, lazy=True)
+        raw['income']['ActualPower'] = '200.2'
+        assert data.actual_power == 200.2
+
+        # decoded once
+        raw['income']['ActualPower'] = '300.3'
+        assert data.actual_power == 200.2
+        assert data.energy_total == 300
+        with pytest.raises(AttributeError):
+            data.capacity
+
+    def test_empty_number(self):
+        raw = dict(self.DATA, income=dict(self.DATA['income'], ActualPower=''))
+        data = Data(raw)
+        assert data.energy_total == 300
+        with pytest.raises(AttributeError):
+            data.actual_power
 
-    return create_app
+        data = Data(raw, lazy=True)
+        with pytest.raises(AttributeError):
+            data.actual_power
+
+
+class TestGraph:
+
+    def graph(self):
+        builder = _XmlDictBuilder()
+        builder.feed(GRAPH_RESPONSE.encode('utf-8'))
+        return Graph(builder.close())
+
+    def test_columns(self):
+        graph = self.graph()
+        assert graph.day_power == 1.0
+        assert list(graph.timestamps) == [1000000000.0, 1000000001.0, 1000000002.0]
+        assert list(graph.powers) == [0.0, 1.0, 2.0]
+
+    def test_graph_points(self):
+        graph = self.graph()
+        points = graph.graph_points
+        assert len(points) == 3
+        assert points[1] == {'datetime': datetime.fromtimestamp(1000000001), 'power': 1.0}
+        assert points[-1]['power'] == 2.0
+        assert [point['power'] for point in points[:2]] == [0.0, 1.0]
+
+    def test_to_numpy(self):
+        numpy = pytest.importorskip('numpy')
+        graph = self.graph()
+        timestamps, powers = graph.to_numpy()
+        assert timestamps.dtype == numpy.float64
+        assert powers.tolist() == [0.0, 1.0, 2.0]
+
+    def test_no_points(self):
+        graph = Graph({'daypower': '0.0'})
+        assert len(graph.timestamps) == 0
+        assert list(graph.powers) == []
+        assert len(graph.graph_points) == 0
+
+
+class TestToken:
+
+    def test_repr(self):
+        token = Token({'token': 'secret_token', 'userName': 'user_1'})
+        assert 'secret_token' not in repr(token)
+        assert 'user_1' in repr(token)
+
+
+class TestUrl:
+
+    def test_url(self):
+        portal = SolarPortal('manual', base_url='http://portal/serverapi/?')
+        token = Token({'token': 'a/b', 'userName': 'user 1'})
+        params = portal._token_params('Data', token, 'apitest', stationid='1&2')
+        assert str(portal._url(params)) == \
+            'http://portal/serverapi/?method=Data&username=user%201&token=a%2Fb&key=apitest&stationid=1%262'
+
+        params = portal._token_params('Data', token, 'apitest', stationid='3')
+        assert portal._url(params).query['stationid'] == '3'
+        assert len(portal._url_prefixes) == 1
 
 
 class TestSolarPortal:
@@ -104,6 +287,24 @@ class TestSolarPortal:
         assert powerstation.etoday == 1.0
         assert powerstation.etotal == 300
 
+    async def test_get_powerstations_empty_number(self, test_client):
+        response = '''<?xml version="1.0" encoding="utf-8" ?>
+<list>
+    <status>true</status>
+    <power><stationID>1</stationID><ActualPower></ActualPower><longitude></longitude></power>
+    <power><stationID>2</stationID><ActualPower>100.0</ActualPower></power>
+</list>'''
+        client = await test_client(portal_with_response(response))
+
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        for direct_records in (False, True):
+            portal = SolarPortal('manual', base_url='/serverapi/?', client=client, direct_records=direct_records)
+            powerstations = await portal.async_get_powerstations(token)
+            assert [powerstation.station_id for powerstation in powerstations] == ['1', '2']
+            assert powerstations[1].actual_power == 100.0
+            with pytest.raises(AttributeError):
+                powerstations[0].actual_power
+
     async def test_powerstation_count(self, test_client):
         response = '''<?xml version="1.0" encoding="utf-8" ?>
 <list>
@@ -250,3 +451,237 @@ class TestSolarPortal:
         portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
         token = Token({'token': 'test_token', 'userName': 'user_1'})
         await portal.async_logout(token)
+
+    async def test_pooled_session(self, test_server, loop):
+        response = '''<?xml version="1.0" encoding="utf-8" ?>
+<login>
+    <status>true</status>
+    <errorCode> </errorCode>
+    <errorMessage> </errorMessage>
+    <userID>1</userID>
+    <userName>user_1</userName>
+    <token>token_string</token>
+</login>'''
+        server = await test_server(portal_with_response(response)(loop))
+
+        base_url = str(server.make_url('/serverapi/')) + '?'
+        async with SolarPortal('manual', base_url=base_url) as portal:
+            await portal.async_login('user_1', 'password_1')
+            session = portal._session
+            await portal.async_login('user_1', 'password_1')
+            assert portal._session is session
+            assert not session.closed
+
+        assert session.closed
+        assert portal._session is None
+
+    async def test_get_data_many(self, test_client):
+        client = await test_client(portal_with_handler(respond_data))
+
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstations = [Powerstation({'stationID': str(i)}) for i in range(1, 4)]
+        results = await portal.async_get_data_many(token, powerstations, concurrency=2)
+        assert len(results) == 3
+        assert results[0].name == 'station_1'
+        assert isinstance(results[1], SolarPortalError)
+        assert results[2].name == 'station_3'
+
+    async def test_get_data_many_invalid_response(self, test_client):
+        def handler(request):
+            if request.query['stationid'] == '2':
+                return web.Response(body='<html>maintenance')
+            return web.Response(body=DATA_RESPONSE.format(station_id=request.query['stationid']))
+
+        client = await test_client(portal_with_handler(handler))
+
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstations = [Powerstation({'stationID': str(i)}) for i in range(1, 4)]
+        results = await portal.async_get_data_many(token, powerstations, concurrency=2)
+        assert results[0].name == 'station_1'
+        assert isinstance(results[1], SolarPortalParseError)
+        assert results[2].name == 'station_3'
+
+    async def test_aiter_data_many(self, test_client):
+        client = await test_client(portal_with_handler(respond_data))
+
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstations = [Powerstation({'stationID': str(i)}) for i in range(1, 4)]
+        results = {}
+        async for powerstation, result in portal.aiter_data_many(token, powerstations):
+            results[powerstation.station_id] = result
+        assert results['1'].actual_power == 100.0
+        assert isinstance(results['2'], SolarPortalError)
+        assert results['3'].actual_power == 300.0
+
+    async def test_cache(self, test_client):
+        requests = []
+
+        def respond(request):
+            requests.append(request.query['method'])
+            if request.query['method'] == 'Graph':
+                return web.Response(body=GRAPH_RESPONSE)
+            return respond_data(request)
+
+        client = await test_client(portal_with_handler(respond))
+
+        cache = ResponseCache()
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, cache=cache)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstation = Powerstation({'stationID': '1'})
+        data_1 = await portal.async_get_data(token, powerstation)
+        data_2 = await portal.async_get_data(token, powerstation)
+        assert data_1.actual_power == data_2.actual_power
+        assert requests == ['Data']
+        assert cache.hits == 1
+
+        await portal.async_get_graph(token, powerstation, datetime(2018, 1, 1), '1')
+        await portal.async_get_graph(token, powerstation, datetime(2018, 1, 1), '1')
+        assert requests == ['Data', 'Graph']
+
+        # graphs for past days never expire
+        expires = [expires for data, expires in cache._entries.values() if 'graph' in data]
+        assert expires == [None]
+
+    async def test_cache_empty_last_updated(self, test_client):
+        requests = []
+
+        def respond(request):
+            requests.append(request.query['method'])
+            body = DATA_RESPONSE.format(station_id=request.query['stationid'])
+            return web.Response(body=body.replace('<lastupdated>1000000000</lastupdated>', '<lastupdated />'))
+
+        client = await test_client(portal_with_handler(respond))
+
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client, cache=ResponseCache())
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstation = Powerstation({'stationID': '1'})
+        data = await portal.async_get_data(token, powerstation)
+        assert data.actual_power == 100.0
+        await portal.async_get_data(token, powerstation)
+        assert requests == ['Data']
+
+    async def test_coalesce(self, test_client):
+        requests = []
+
+        async def respond(request):
+            requests.append(request.query['stationid'])
+            await asyncio.sleep(0.01)
+            return respond_data(request)
+
+        client = await test_client(portal_with_handler(respond))
+
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstations = [Powerstation({'stationID': station_id}) for station_id in ('1', '1', '1', '3')]
+        results = await asyncio.gather(*[
+            portal.async_get_data(token, powerstation)
+            for powerstation in powerstations
+        ])
+        assert sorted(requests) == ['1', '3']
+        assert [data.name for data in results] == ['station_1', 'station_1', 'station_1', 'station_3']
+        assert not portal._in_flight
+
+        await portal.async_get_data(token, powerstations[0])
+        assert sorted(requests) == ['1', '1', '3']
+
+    async def test_aiter_errors(self, test_client):
+        errors = [1000000400, 1000000300, 1000000200, 1000000100, 1000000000]
+        requests = []
+
+        def respond(request):
+            page, per_page = int(request.query['page']), int(request.query['perPage'])
+            requests.append(page)
+            body = '<errors><status>true</status><errTotal>{}</errTotal>'.format(len(errors))
+            for timestamp in errors[(page - 1) * per_page:page * per_page]:
+                body += '<error><DateTime>{}</DateTime><invErrCode>1015</invErrCode></error>'.format(timestamp)
+            return web.Response(body=body + '</errors>')
+
+        client = await test_client(portal_with_handler(respond))
+
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstation = Powerstation({'stationID': '1'})
+        result = [error async for error in portal.aiter_errors(token, powerstation, per_page=2)]
+        assert [error.datetime.timestamp() for error in result] == errors
+        assert requests == [1, 2, 3]
+
+        # only new errors
+        requests.clear()
+        errors.insert(0, 1000000500)
+        result = [error async for error in portal.aiter_errors(token, powerstation, per_page=2)]
+        assert [error.datetime.timestamp() for error in result] == [1000000500]
+        assert requests == [1]
+
+        requests.clear()
+        since = datetime.fromtimestamp(1000000250)
+        result = [error async for error in portal.aiter_errors(token, powerstation, since=since, per_page=2)]
+        assert len(result) == 3
+        assert requests == [1, 2]
+
+    async def test_aiter_errors_failed_page(self, test_client):
+        errors = [1000000000 - i * 100 for i in range(10)]
+        failures = [2]
+
+        def respond(request):
+            page, per_page = int(request.query['page']), int(request.query['perPage'])
+            if page in failures:
+                failures.remove(page)
+                return web.Response(status=503)
+            body = '<errors><status>true</status><errTotal>{}</errTotal>'.format(len(errors))
+            for timestamp in errors[(page - 1) * per_page:page * per_page]:
+                body += '<error><DateTime>{}</DateTime><invErrCode>1015</invErrCode></error>'.format(timestamp)
+            return web.Response(body=body + '</errors>')
+
+        client = await test_client(portal_with_handler(respond))
+
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstation = Powerstation({'stationID': '1'})
+        result = []
+        with pytest.raises(SolarPortalError):
+            async for error in portal.aiter_errors(token, powerstation, per_page=5):
+                result.append(error)
+        assert len(result) == 5
+
+        # not delivered before the failure, so fetched again
+        result = [error async for error in portal.aiter_errors(token, powerstation, per_page=5)]
+        assert [error.datetime.timestamp() for error in result] == errors
+
+        result = [error async for error in portal.aiter_errors(token, powerstation, per_page=5)]
+        assert result == []
+
+    async def test_aiter_powerstations(self, test_client):
+        requests = []
+
+        def respond(request):
+            requests.append((request.query['method'], request.query.get('page')))
+            if request.query['method'] == 'PowerstationslistCount':
+                return web.Response(body='<list><recordCount>5</recordCount></list>')
+
+            page, per_page = int(request.query['page']), int(request.query['perPage'])
+            body = '<list><status>true</status>'
+            for station_id in range((page - 1) * per_page + 1, min(page * per_page, 5) + 1):
+                body += '<power><stationID>{}</stationID></power>'.format(station_id)
+            return web.Response(body=body + '</list>')
+
+        client = await test_client(portal_with_handler(respond))
+
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        token = Token({'token': 'test_token', 'userName': 'user_1'})
+        powerstations = [p async for p in portal.aiter_powerstations(token, per_page=2)]
+        assert sorted(p.station_id for p in powerstations) == ['1', '2', '3', '4', '5']
+        assert requests[0] == ('PowerstationslistCount', None)
+        assert sorted(requests[1:]) == [
+            ('Powerstationslist', '1'),
+            ('Powerstationslist', '2'),
+            ('Powerstationslist', '3'),
+        ]
+
+        # cached list
+        requests.clear()
+        powerstations = [p async for p in portal.aiter_powerstations(token, per_page=2, max_age=timedelta(hours=1))]
+        assert len(powerstations) == 5
+        assert requests == []
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""Tests for local time-series store."""
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import timezone
+
+from solarportal import GRAPH_TYPE_DAY
+from solarportal import GRAPH_TYPE_MONTH
+from solarportal import Graph
+from solarportal.store import TimeSeriesStore
+
+
+START = int(datetime(2018, 1, 1, tzinfo=timezone.utc).timestamp())
+
+
+def utc(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc)
+
+
+def graph(points):
+    return Graph({
+        'daypower': '1.0', 'income': '1.0', 'savetree': '0.1', 'saveco2': '0.1',
+        'graph': [{'datetime': str(timestamp), 'power': str(power)} for timestamp, power in points],
+    })
+
+
+class TestTimeSeriesStore:
+
+    def store(self, tmpdir, **kwargs):
+        kwargs.setdefault('clock', lambda: START + 2 * 86400)
+        return TimeSeriesStore(str(tmpdir.join('store.db')), **kwargs)
+
+    def test_batches(self, tmpdir):
+        store = self.store(tmpdir, batch_size=3)
+        store.add_sample('1', START, 100.0)
+        store.add_sample('1', START + 300, 200.0)
+        assert store.query('1', utc(START), utc(START + 3600)) == []
+
+        store.add_sample('1', START + 600, 300.0)
+        assert store.query('1', utc(START), utc(START + 3600)) == [
+            (START, 100.0, None, None),
+            (START + 300, 200.0, None, None),
+            (START + 600, 300.0, None, None),
+        ]
+        store.close()
+
+    def test_rollup(self, tmpdir):
+        store = self.store(tmpdir)
+        for i in range(24):
+            store.add_sample('1', START + i * 300, float(i), etoday=i / 10)
+        store.add_sample('2', START, 1000.0)
+        store.flush()
+
+        assert store.query('1', utc(START), utc(START + 86400), 'hour') == [
+            (START, 5.5, 11.0, 1.1, 12),
+            (START + 3600, 17.5, 23.0, 2.3, 12),
+        ]
+        assert store.query('1', utc(START), utc(START + 86400), 'day') == [
+            (START, 11.5, 23.0, 2.3, 24),
+        ]
+
+        # late samples update their buckets
+        store.add_sample('1', START + 7200, 100.0)
+        store.flush()
+        assert store.query('1', utc(START), utc(START + 86400), 'day')[0][2:] == (100.0, 2.3, 25)
+        store.close()
+
+    def test_retention(self, tmpdir):
+        store = self.store(tmpdir, retention={'raw': timedelta(days=1)})
+        store.add_sample('1', START, 100.0)
+        store.add_sample('1', START + 86400 + 3600, 200.0)
+        store.flush()
+
+        assert store.query('1', utc(START), utc(START + 2 * 86400)) == [(START + 86400 + 3600, 200.0, None, None)]
+        assert len(store.query('1', utc(START), utc(START + 2 * 86400), 'hour')) == 2
+        store.close()
+
+    def test_rollup_after_retention(self, tmpdir):
+        now = [START + 86400 + 3600]
+        store = self.store(tmpdir, clock=lambda: now[0],
+                           retention={'raw': timedelta(hours=30), 'hour': timedelta(hours=36)})
+        for i in range(24):
+            store.add_sample('1', START + i * 3600, 50.0)
+        store.flush()
+        assert store.query('1', utc(START), utc(START + 86400), 'day') == [(START, 50.0, 50.0, None, 24)]
+
+        # retention removed part of the buckets of station 1, they are not recomputed
+        now[0] = START + 2 * 86400
+        store.add_sample('2', START, 10.0)
+        store.flush()
+        assert store.query('1', utc(START), utc(START + 86400), 'day') == [(START, 50.0, 50.0, None, 24)]
+        assert store.query('2', utc(START), utc(START + 86400), 'day') == [(START, 10.0, 10.0, None, 1)]
+
+        store.add_sample('1', START + 23 * 3600 + 60, 110.0)
+        store.flush()
+        assert store.query('1', utc(START), utc(START + 86400), 'day') == [(START, 50.0, 50.0, None, 24)]
+        assert store.query('1', utc(START + 23 * 3600), utc(START + 86400), 'hour') == \
+            [(START + 23 * 3600, 80.0, 110.0, None, 2)]
+        store.close()
+
+    def test_graphs(self, tmpdir):
+        store = self.store(tmpdir)
+        store.write_graph('1', GRAPH_TYPE_DAY, graph([(START, 1.0), (START + 300, 2.0)]))
+        store.write_graph('1', GRAPH_TYPE_MONTH, graph([(START, 10.0), (START + 86400, 12.0)]))
+        store.flush()
+
+        assert len(store.query('1', utc(START), utc(START + 3600))) == 2
+        assert store.query_totals('1', GRAPH_TYPE_MONTH, utc(START), utc(START + 2 * 86400)) == [
+            (START, 10.0),
+            (START + 86400, 12.0),
+        ]
+        store.close()
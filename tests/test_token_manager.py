@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Tests for token management."""
+
+import asyncio
+from datetime import datetime
+from datetime import timedelta
+
+from aiohttp import web
+
+from solarportal import SolarPortal
+from solarportal import Token
+from solarportal.token_manager import TokenManager
+
+from helpers import portal_with_handler
+
+
+LOGIN_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<login>
+    <status>true</status>
+    <errorCode> </errorCode>
+    <errorMessage> </errorMessage>
+    <userID>1</userID>
+    <userName>user_1</userName>
+    <token>token_{count}</token>
+</login>'''
+
+COUNT_RESPONSE = '''<?xml version="1.0" encoding="utf-8" ?>
+<list>
+    <status>{status}</status>
+    <errorCode>1</errorCode>
+    <errorMessage>Logged out</errorMessage>
+    <recordCount>1</recordCount>
+</list>'''
+
+
+def create_portal_app(calls):
+    async def respond(request):
+        method = request.query['method']
+        calls.append(method)
+        if method == 'Login':
+            await asyncio.sleep(0.01)
+            return web.Response(body=LOGIN_RESPONSE.format(count=calls.count('Login')))
+
+        # only the second token is accepted
+        status = 'true' if request.query['token'] == 'token_2' else 'false'
+        return web.Response(body=COUNT_RESPONSE.format(status=status))
+
+    return portal_with_handler(respond)
+
+
+class TestTokenManager:
+
+    async def test_single_flight_login(self, test_client):
+        calls = []
+        client = await test_client(create_portal_app(calls))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+
+        manager = TokenManager()
+        tokens = await asyncio.gather(*[
+            manager.async_get_token(portal, 'user_1', 'password_1')
+            for _ in range(5)
+        ])
+        assert calls == ['Login']
+        assert all(token is tokens[0] for token in tokens)
+
+    async def test_refresh_expired(self, test_client):
+        calls = []
+        client = await test_client(create_portal_app(calls))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+
+        manager = TokenManager(ttl=timedelta(minutes=10), refresh_margin=timedelta(minutes=1))
+        token = await manager.async_get_token(portal, 'user_1', 'password_1')
+        assert await manager.async_get_token(portal, 'user_1', 'password_1') is token
+
+        token.created = datetime.now() - timedelta(minutes=9, seconds=30)
+        new_token = await manager.async_get_token(portal, 'user_1', 'password_1')
+        assert new_token.token == 'token_2'
+
+    async def test_retry_after_login(self, test_client):
+        calls = []
+        client = await test_client(create_portal_app(calls))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+
+        manager = TokenManager()
+        count = await manager.async_call(portal, 'user_1', 'password_1', portal.async_get_powerstation_count)
+        assert count == 1
+        assert calls == ['Login', 'PowerstationslistCount', 'Login', 'PowerstationslistCount']
+
+    async def test_persist(self, test_client, tmpdir):
+        calls = []
+        client = await test_client(create_portal_app(calls))
+        portal = SolarPortal('manual', base_url='/serverapi/?', client=client)
+        path = str(tmpdir.join('tokens.json'))
+
+        manager = TokenManager(path=path)
+        token = await manager.async_get_token(portal, 'user_1', 'password_1')
+
+        manager = TokenManager(path=path)
+        restored = await manager.async_get_token(portal, 'user_1', 'password_1')
+        assert isinstance(restored, Token)
+        assert restored.token == token.token
+        assert restored.created == token.created
+        assert calls == ['Login']
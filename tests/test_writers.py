@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Tests for buffered writers."""
+
+import os
+from datetime import datetime
+
+import pytest
+
+from solarportal.writers import BinaryLogWriter
+from solarportal.writers import CsvWriter
+from solarportal.writers import ParquetWriter
+from solarportal.writers import read_binary_log
+
+
+ROW = (1000000000, '1', 100.1, 1.0, 10.0, 1.0, 300)
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = datetime(2018, 1, 1, 12, 0).timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+def read_lines(filename):
+    with open(filename) as fd:
+        return fd.read().splitlines()
+
+
+class TestCsvWriter:
+
+    def test_batch(self, tmpdir):
+        path = str(tmpdir.join('output.csv'))
+        clock = Clock()
+        writer = CsvWriter(path, flush_rows=3, flush_interval=60, clock=clock)
+        writer.write(ROW)
+        writer.write(ROW)
+        assert not os.path.exists(path)
+
+        writer.write(ROW)
+        assert len(read_lines(path)) == 4
+
+        writer.write(ROW)
+        clock.now += 60
+        writer.write(ROW)
+        assert len(read_lines(path)) == 6
+
+        writer.close()
+        assert read_lines(path)[:2] == [
+            'timestamp;station;ActualPower;TodayIncome;TotalIncome;etoday;etotal',
+            '1000000000;1;100.1;1.0;10.0;1.0;300',
+        ]
+
+    def test_rotate_daily(self, tmpdir):
+        path = str(tmpdir.join('output.csv'))
+        clock = Clock()
+        writer = CsvWriter(path, flush_rows=1, rotate='daily', clock=clock)
+        writer.write(ROW)
+        clock.now += 24 * 60 * 60
+        writer.write(ROW)
+        writer.close()
+
+        assert sorted(os.listdir(str(tmpdir))) == ['output-2018-01-01.csv', 'output-2018-01-02.csv']
+        assert len(read_lines(str(tmpdir.join('output-2018-01-02.csv')))) == 2
+
+    def test_rotate_size(self, tmpdir):
+        path = str(tmpdir.join('output.csv'))
+        writer = CsvWriter(path, flush_rows=1, max_bytes=120)
+        for _ in range(3):
+            writer.write(ROW)
+        writer.close()
+
+        assert sorted(os.listdir(str(tmpdir))) == ['output.1.csv', 'output.csv']
+
+
+class TestBinaryLogWriter:
+
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join('output.bin'))
+        writer = BinaryLogWriter(path)
+        writer.write(ROW)
+        writer.write((1000000300, 'station_2', 0.0, 0.0, 0.0, 0.0, 0))
+        writer.close()
+
+        rows = list(read_binary_log(path))
+        assert rows == [ROW, (1000000300, 'station_2', 0.0, 0.0, 0.0, 0.0, 0)]
+
+
+class TestParquetWriter:
+
+    def test_write(self, tmpdir):
+        parquet = pytest.importorskip('pyarrow.parquet')
+        path = str(tmpdir.join('output.parquet'))
+        writer = ParquetWriter(path, flush_rows=1)
+        writer.write(ROW)
+        writer.write(ROW)
+        writer.close()
+
+        table = parquet.read_table(path)
+        assert table.num_rows == 2
+        assert table.column('station').to_pylist() == ['1', '1']